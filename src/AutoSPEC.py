@@ -4,6 +4,8 @@
 # Time-stamp: <Last updated: ZHAO,Ya-Fan yafanzhao@163.com 2022-02-03 10:53:19>
 
 import enum
+import asyncio
+import signal
 import subprocess
 import re
 import json
@@ -13,8 +15,19 @@ import copy
 import random
 import math
 import os
+import time
+import shutil
+import hashlib
+import sqlite3
+import uuid
+import fcntl
+import mmap
 import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from contextlib import contextmanager
 from configparser import ConfigParser, NoOptionError
+from RunWithUsage import UsageMarker
 
 """
 INT:
@@ -222,23 +235,173 @@ if not Logger.handlers:
     Logger.addHandler(stdout_handler)
 Logger.propagate = False
 
+# one pattern for all the lines AutoSPEC needs from a log file or from the output of runspec.
+# The outer named group of the alternative that matched is m.lastgroup.
+LogLineSource = (r"(?:"
+                 r"(?P<success>[ \t]+Success (?P<s_no>\d+)\.(?P<s_name>\w+) (?P<s_tune>\w+) (?P<s_size>\w+) ratio=(?P<s_ratio>\S+), runtime=(?P<s_time>\d+\.\d+))"
+                 r"|(?P<benchmarks>Running Benchmarks)[ \t\r]*$"
+                 r"|(?P<running>[ \t]*Running (?P<r_no>\d+)\.(?P<r_name>\w+) (?P<r_size>\w+) (?P<r_tune>\w+))"
+                 r"|(?P<config>[ \t]*Reading config file '(?P<config_file>[^'\r\n]*)')"
+                 r"|(?P<logname>(?:logname[ \t]+=[ \t]+|[ \t]*The log for this run is in )(?P<log_name>[^\r\n]*))"
+                 r"|(?P<build_error>\*\*\* Error building (?P<b_no>\d+)\.(?P<b_name>\w+))"
+                 r"|(?P<build_errors>Build errors: (?P<b_list>[^\r\n]*))"
+                 r"|(?P<compile>[ \t]*Elapsed compile for '(?P<c_no>\d+)\.(?P<c_name>\w+)': [^(\r\n]*\((?P<c_time>\d+)\))"
+                 r"|(?P<usage>" + re.escape(UsageMarker) + r"(?P<usage_json>\{[^\r\n]*\}))"
+                 r")")
+LogLinePattern = re.compile(LogLineSource)
+# the scan of a whole log jumps from one newline to the next one, which is much faster than ^ in MULTILINE mode.
+LogFirstLinePattern = re.compile(LogLineSource.encode(), re.M)
+LogScanPattern = re.compile(b"\n" + LogLineSource.encode(), re.M)
+BenchPattern = re.compile(r"(\d+)\.(\w+)")
+# runspec is started through this script, which prints the resource usage of its process tree after UsageMarker.
+UsageWrapper = os.path.join(os.path.dirname(os.path.abspath(__file__)), "RunWithUsage.py")
+# how often (in seconds) a running benchmark is checked against the cutoff policy.
+CutoffInterval = 5.0
+# how many random candidates a stochastic search draws to find one which is valid and has not been measured yet.
+NewCandidateTries = 20
+
+def res_from_match(m_ratio):
+    """
+    convert a success match of LogLinePattern or LogScanPattern to a result dict.
+    """
+    fields = [m_ratio.group(name) for name in ["s_no", "s_name", "s_tune", "s_size", "s_ratio", "s_time"]]
+    if isinstance(fields[0], bytes):
+        fields = [field.decode() for field in fields]
+    MyDict = {}
+    MyDict["BenchNO"] = fields[0]
+    MyDict["BenchName"] = fields[1]
+    MyDict["Tune"] = fields[2]
+    MyDict["BenchSize"] = fields[3]
+    MyDict["Ratio"] = float(fields[4])
+    MyDict["RunTime"] = float(fields[5])
+    if MyDict["BenchNO"] in Benchmarks["int"].keys():
+        MyDict["PointType"] = "int"
+    elif MyDict["BenchNO"] in Benchmarks["fp"].keys():
+        MyDict["PointType"] = "fp"
+    else:
+        MyDict["PointType"] = ""
+    return MyDict
+
+def add_usage(total, usage):
+    """
+    add the resource usage of one runspec call to the usage of a job, the peak RSS is the largest one.
+    """
+    for name, value in usage.items():
+        if name == "maxrss_kb":
+            total[name] = max(total.get(name, 0), value)
+        else:
+            total[name] = round(total.get(name, 0) + value, 3)
+    return total
+
+class spec_log(object):
+    """
+    the information in a log file of SPEC CPU 2006, or in the output of runspec, collected in a single pass.
+    """
+    def __init__(self):
+        self.config_file = ""
+        self.log_name = ""
+        self.result = []
+        self.build_errors = []
+        # the seconds to compile each benchmark, by benchmark number.
+        self.compile_times = {}
+        # the offsets of the "Running Benchmarks" lines.
+        self.sections = []
+        # a (benchmark number, benchmark name, size, tune, start, end) tuple for the output of each benchmark run.
+        self.runs = []
+
+    @classmethod
+    def from_file(cls, log_file):
+        """
+        parse a log file through mmap, without reading it into memory.
+        Args:
+            log_file (str): the name of the log file
+        """
+        log = cls()
+        with open(log_file, "rb") as fp:
+            if os.fstat(fp.fileno()).st_size == 0:
+                return log
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                log.scan(data)
+        return log
+
+    @classmethod
+    def from_lines(cls, lines):
+        """
+        parse a list of lines, the offsets are line numbers.
+        """
+        log = cls()
+        for i, line in enumerate(lines):
+            m = LogLinePattern.match(line)
+            if m:
+                log.add(m, i)
+        log.close_run(len(lines))
+        return log
+
+    def scan(self, data):
+        """
+        parse bytes or a mmap, the offsets are byte offsets.
+        """
+        m = LogFirstLinePattern.match(data)
+        if m:
+            self.add(m, 0)
+        for m in LogScanPattern.finditer(data):
+            self.add(m, m.start() + 1)
+        self.close_run(len(data))
+
+    def close_run(self, end):
+        """
+        end the output of the last benchmark run at end.
+        """
+        if len(self.runs) > 0 and self.runs[-1][5] is None:
+            self.runs[-1] = self.runs[-1][:5] + (end,)
+
+    def add(self, m, offset):
+        """
+        record a match of the log pattern found at offset.
+        """
+        kind = m.lastgroup
+        if kind == "success":
+            self.result.append(res_from_match(m))
+            return
+        if kind in ["running", "benchmarks"]:
+            self.close_run(offset)
+        fields = m.groupdict()
+        for name, value in fields.items():
+            if isinstance(value, bytes):
+                fields[name] = value.decode(errors="replace")
+        if kind == "running":
+            self.runs.append((fields["r_no"], fields["r_name"], fields["r_size"], fields["r_tune"], offset, None))
+        elif kind == "benchmarks":
+            self.sections.append(offset)
+        elif kind == "config":
+            if not self.config_file:
+                self.config_file = fields["config_file"]
+        elif kind == "logname":
+            if not self.log_name:
+                self.log_name = fields["log_name"].strip()
+        elif kind == "compile":
+            self.compile_times[fields["c_no"]] = self.compile_times.get(fields["c_no"], 0) + int(fields["c_time"])
+        elif kind == "build_error":
+            self.add_build_error(fields["b_no"], fields["b_name"])
+        elif kind == "build_errors":
+            for m_bench in BenchPattern.finditer(fields["b_list"]):
+                self.add_build_error(m_bench.group(1), m_bench.group(2))
+
+    def add_build_error(self, bench_no, bench_name):
+        bench = (bench_no, bench_name)
+        if bench not in self.build_errors:
+            self.build_errors.append(bench)
+
 def SplitLog(LogLines):
     """
     a function to split the log file into several blocks.
 
     Args:
         LogLines (list): lines in the log file.
+    Returns:
+        list: the line number of each "Running Benchmarks" line, and the number of lines at the end.
     """
-    LineNum = len(LogLines)
-    i = 0
-    RunningBenchmarkLines = []
-    while i < LineNum:
-        Line = LogLines[i]
-        m_Running = re.search("^Running Benchmarks$", Line)
-        if m_Running:
-            RunningBenchmarkLines.append(i)
-    RunningBenchmarkLines.append(LineNum)
-    return RunningBenchmarkLines
+    return spec_log.from_lines(LogLines).sections + [len(LogLines)]
 
 def ExtractResFromLog(LogLines):
     """
@@ -246,28 +409,206 @@ def ExtractResFromLog(LogLines):
     Args:
         LogLines (list): lines of the log file
     """
-    SPEC_INT = Benchmarks["int"]
-    SPEC_FP = Benchmarks["fp"]
     Res = []
     for Line in LogLines:
-        m_ratio = re.search(r"^\s+Success (\d+).(\w+) (\w+) (\w+) ratio=(\S+), runtime=(\d+\.\d+)", Line)
-        if m_ratio:
-            MyDict = {}
-            MyDict["BenchNO"] = m_ratio.group(1)
-            MyDict["BenchName"] = m_ratio.group(2)
-            MyDict["Tune"] = m_ratio.group(3)
-            MyDict["BenchSize"] = m_ratio.group(4)
-            MyDict["Ratio"] = float(m_ratio.group(5))
-            MyDict["RunTime"] = float(m_ratio.group(6))
-            if MyDict["BenchNO"] in SPEC_INT.keys():
-                MyDict["PointType"] = "int"
-            elif MyDict["BenchNO"] in SPEC_FP.keys():
-                MyDict["PointType"] = "fp"
-            else:
-                MyDict["PointType"] = ""
-            Res.append(MyDict)
+        m = LogLinePattern.match(Line)
+        if m and m.lastgroup == "success":
+            Res.append(res_from_match(m))
     return Res
 
+class cutoff_policy(object):
+    """
+    decide whether a running benchmark is already slower than the best known run.
+    """
+    def __init__(self, incumbent_runtimes, margin, iterations=1):
+        """
+        Args:
+            incumbent_runtimes (dict): the runtime of the best job for each benchmark number
+            margin (float): the relative margin, 0.1 means 10% slower than the incumbent
+            iterations (int): the number of iterations of each benchmark in one run
+        """
+        self.incumbent_runtimes = incumbent_runtimes
+        self.margin = margin
+        self.iterations = iterations
+
+    def time_limit(self, bench_no):
+        """
+        the time limit of a benchmark, or None if there is no incumbent.
+        """
+        if bench_no not in self.incumbent_runtimes:
+            return None
+        return self.incumbent_runtimes[bench_no] * self.iterations * (1.0 + self.margin)
+
+    def exceeded(self, bench_no, elapsed):
+        """
+        return True if the benchmark has been running for longer than its time limit.
+        """
+        limit = self.time_limit(bench_no)
+        return limit is not None and elapsed > limit
+
+class phase_timer(object):
+    """
+    the seconds spent in each phase of the evaluation of a candidate: update_cfg (proposing the candidate and writing
+    its config file), cache, build (with the startup of runspec), run, parse, repeat, persist and wait (for a worker).
+    """
+    def __init__(self):
+        self.spans = {}
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    @contextmanager
+    def span(self, name):
+        """
+        time the code in a with block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def merge(self, other):
+        for name, seconds in other.spans.items():
+            self.add(name, seconds)
+
+    def share(self, num):
+        """
+        the share of each of num candidates evaluated together.
+        """
+        timer = phase_timer()
+        timer.spans = {name: seconds/num for name, seconds in self.spans.items()}
+        return timer
+
+class spec_output_parser(object):
+    """
+    an incremental parser for the output of runspec.
+    Lines are fed one by one while runspec is running, only the parsed information is kept.
+    """
+    def __init__(self, on_log_name=None, on_result=None, on_build_error=None):
+        """
+        Args:
+            on_log_name (callable): called with the name of the log file
+            on_result (callable): called with each result dict
+            on_build_error (callable): called with the number and name of each benchmark failed to build
+        """
+        self.on_log_name = on_log_name
+        self.on_result = on_result
+        self.on_build_error = on_build_error
+        self.log_name = ""
+        self.result = []
+        self.build_errors = []
+        self.returncode = None
+        self.proc = None
+        # called with the process of runspec when it starts.
+        self.on_start = None
+        self.cutoff = None
+        self.dominated = False
+        self.running_bench = None
+        self.running_since = None
+        # the seconds of the finished iterations of each benchmark, the limit of the cutoff covers all the iterations.
+        self.bench_elapsed = {}
+        # when the "Running Benchmarks" line arrived, the end of the build phase.
+        self.run_started = None
+        self.timer = phase_timer()
+        # the resource usage of the runspec process tree, from the "AutoSPEC usage:" line.
+        self.usage = {}
+        # the seconds to compile each benchmark, by benchmark number.
+        self.compile_times = {}
+
+    def feed(self, line):
+        """
+        parse one line of the output.
+        """
+        m = LogLinePattern.match(line)
+        if m is None:
+            return
+        kind = m.lastgroup
+        if kind == "benchmarks":
+            self.run_started = time.monotonic()
+        elif kind == "running":
+            # runspec prints a Running line for each iteration.
+            now = time.monotonic()
+            if self.running_bench is not None:
+                self.bench_elapsed[self.running_bench] = self.bench_elapsed.get(self.running_bench, 0.0) + now - self.running_since
+            self.running_bench = m.group("r_no")
+            self.running_since = now
+        elif kind == "success":
+            res = res_from_match(m)
+            self.result.append(res)
+            if self.on_result is not None:
+                self.on_result(res)
+        elif kind == "logname":
+            if not self.log_name:
+                self.log_name = m.group("log_name").strip()
+                if self.on_log_name is not None:
+                    self.on_log_name(self.log_name)
+        elif kind in ["build_error", "build_errors"]:
+            if kind == "build_error":
+                benches = [(m.group("b_no"), m.group("b_name"))]
+            else:
+                benches = [(m_bench.group(1), m_bench.group(2)) for m_bench in BenchPattern.finditer(m.group("b_list"))]
+            for bench in benches:
+                if bench not in self.build_errors:
+                    self.build_errors.append(bench)
+                    if self.on_build_error is not None:
+                        self.on_build_error(*bench)
+        elif kind == "compile":
+            self.compile_times[m.group("c_no")] = self.compile_times.get(m.group("c_no"), 0) + int(m.group("c_time"))
+        elif kind == "usage":
+            try:
+                add_usage(self.usage, json.loads(m.group("usage_json")))
+            except ValueError:
+                Logger.warning("Cannot parse the resource usage: %s", m.group("usage_json"))
+
+    def read_compile_times(self):
+        """
+        runspec writes the compile times only to its log file, read them from there once runspec is done.
+        """
+        if len(self.compile_times) == 0 and self.log_name and os.path.exists(self.log_name):
+            self.compile_times = spec_log.from_file(self.log_name).compile_times
+        return self.compile_times
+
+    def check_cutoff(self):
+        """
+        kill runspec if the running benchmark exceeds the time limit of the cutoff policy.
+        """
+        if self.cutoff is None or self.running_bench is None or self.dominated:
+            return
+        elapsed = self.bench_elapsed.get(self.running_bench, 0.0) + time.monotonic() - self.running_since
+        if self.cutoff.exceeded(self.running_bench, elapsed):
+            Logger.warning("Benchmark %s has been running for %.1f s, longer than the limit of %.1f s.",
+                           self.running_bench, elapsed, self.cutoff.time_limit(self.running_bench))
+            self.dominated = True
+            self.kill()
+
+    def split(self, bench_no):
+        """
+        the part of the parsed output about one benchmark, for a runspec call which ran several benchmarks.
+        Args:
+            bench_no (str): the number of the benchmark
+        """
+        part = spec_output_parser()
+        part.log_name = self.log_name
+        part.returncode = self.returncode
+        part.result = [res for res in self.result if res["BenchNO"] == bench_no]
+        part.build_errors = [bench for bench in self.build_errors if bench[0] == bench_no]
+        # the usage is the one of the whole call, the share of each benchmark is not known.
+        part.usage = dict(self.usage)
+        part.compile_times = {no: seconds for no, seconds in self.read_compile_times().items() if no == bench_no}
+        return part
+
+    def kill(self):
+        """
+        kill the running runspec and all its children.
+        """
+        if self.proc is not None and self.proc.returncode is None:
+            Logger.warning("Killing runspec with pid %d", self.proc.pid)
+            try:
+                os.killpg(self.proc.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
 def filter_res(Res, Tune, BenchSize, PointType):
     """
     filter the result by the type and size of the benchmark.
@@ -351,11 +692,28 @@ def load_json(JSONFile):
 
 def dump_json(MyDict, JSONFile):
     """
-    Dump a dict to a json file
+    Dump a dict to a json file.
+    The content is written to a temporary file first and then renamed, so a crash will not leave a half-written file.
     """
-    with open(JSONFile, "w") as f:
+    tmp_file = "%s.tmp.%d" % (JSONFile, os.getpid())
+    with open(tmp_file, "w") as f:
         json.dump(MyDict, f, indent=4)
         f.close()
+    os.replace(tmp_file, JSONFile)
+
+@contextmanager
+def locked_file(file_name):
+    """
+    an exclusive lock on file_name, shared by all the AutoSPEC processes on this machine.
+    Args:
+        file_name (str): the file to protect. The lock is held on file_name.lock.
+    """
+    with open("%s.lock" % (file_name), "a") as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
 
 def GetBaseFlags(CFGLines, start, end):
     """
@@ -412,7 +770,7 @@ def GetPeakFlags(CFGLines, start, end):
         if m_benchmark:
             BenchNO = m_benchmark.group(1)
             Flags[BenchNO] = {}
-            while True:
+            while i + 1 < end:
                 i += 1
                 Line = CFGLines[i]
                 m_OPTIMIZE = re.search(r"(\w+OPTIMIZE)\s+=", Line)
@@ -426,6 +784,9 @@ def GetPeakFlags(CFGLines, start, end):
                     Flags[BenchNO][FlagName] = i
                 elif m_Blank:
                     break
+                elif CFGSectionPattern.search(Line):
+                    i -= 1
+                    break
         i += 1
     return Flags
 
@@ -485,10 +846,10 @@ def UpdateCFG(CFGLines, CFG, NewFlags):
     """
     given the new gcc flags, generate a new CFG 
     """
-    NewCFGLines = copy.deepcopy(CFGLines)
+    NewCFGLines = list(CFGLines)
     for FlagType in ["int_base", "fp_base"]:
         if FlagType in NewFlags.keys():
-            for FlagName, FlagValue in NewFlags[FlagType].keys():
+            for FlagName, FlagValue in NewFlags[FlagType].items():
                 LineNum = CFG[FlagType][FlagName]
                 MyLine = "%s = %s\n" % (FlagName, FlagValue)
                 NewCFGLines[LineNum] = MyLine
@@ -496,56 +857,354 @@ def UpdateCFG(CFGLines, CFG, NewFlags):
         for BenchNO, Flag in NewFlags["peak"].items():
             for FlagName, FlagValue in Flag.items():
                 LineNum = CFG["peak"][BenchNO][FlagName]
-                MyLine = "%s = %s" % (FlagName, FlagValue)
+                MyLine = "%s = %s\n" % (FlagName, FlagValue)
                 NewCFGLines[LineNum] = MyLine
     return NewCFGLines
 
-def KeepFlags(OldScore, NewScore, KBT):
+CFGSectionPattern = re.compile(r"^\s?([^\s=:#]+=[^\s=:#]+=[^\s=:#]+=[^\s=:#]+):")
+CFGVariablePattern = re.compile(r"^(\w+)\s*=")
+CFGMD5Pattern = re.compile(r"^__MD5__")
+
+class spec_cfg():
+    """
+    a parsed SPEC CPU 2006 config file: the global options, the named sections (like int=base=default=default
+    or 456.hmmer=peak=default=default) and the __MD5__ block written by runspec.
+    Candidate configs are rendered from the cached text of the untouched sections, so that only the
+    overridden lines are generated for each candidate.
+    """
+    def __init__(self, cfg_lines):
+        """
+        Args:
+            cfg_lines (list): content of the config file
+        """
+        self.header = []
+        # the sections in the order of the config file. A section name may appear more than once,
+        # runspec merges them and the last value wins.
+        self.section_names = []
+        self.sections = []
+        self.last_section = {}
+        self.md5 = []
+        lines = self.header
+        for line in cfg_lines:
+            if not line.endswith("\n"):
+                line += "\n"
+            if CFGMD5Pattern.search(line):
+                lines = self.md5
+            elif lines is not self.md5:
+                m = CFGSectionPattern.search(line)
+                if m:
+                    lines = [line]
+                    self.last_section[m.group(1)] = len(self.sections)
+                    self.section_names.append(m.group(1))
+                    self.sections.append(lines)
+                    continue
+            lines.append(line)
+        # the line number of each variable in the global options and in each section.
+        self.header_variables = self.index_variables(self.header)
+        self.variables = [self.index_variables(lines) for lines in self.sections]
+        self.texts = ["".join(lines) for lines in self.sections]
+        self.header_text = "".join(self.header)
+        self.md5_text = "".join(self.md5)
+
+    @staticmethod
+    def index_variables(lines):
+        """
+        map the name of each variable to its line number, the last one wins as in runspec.
+        Args:
+            lines (list): the lines of a section
+        """
+        variables = {}
+        for i, line in enumerate(lines):
+            m = CFGVariablePattern.search(line)
+            if m:
+                variables[m.group(1)] = i
+        return variables
+
+    def get(self, name, section=None, default=None):
+        """
+        the value of a variable.
+        Args:
+            name (str): the name of the variable, like ext or COPTIMIZE
+            section (str): the name of the section, default is the global options
+            default: the value if the variable is not set
+        """
+        if section is None:
+            lines, variables = self.header, self.header_variables
+        else:
+            for k in range(len(self.sections)-1, -1, -1):
+                if self.section_names[k] == section and name in self.variables[k]:
+                    lines, variables = self.sections[k], self.variables[k]
+                    break
+            else:
+                return default
+        i = variables.get(name)
+        if i is None:
+            return default
+        return lines[i].split("=", 1)[1].strip()
+
+    def peak_section(self, bench_no, bench_name):
+        """
+        the name of the peak section of a benchmark, like 456.hmmer=peak=default=default.
+        """
+        return "%s.%s=peak=default=default" % (bench_no, bench_name)
+
+    def base_section(self, bench_name):
+        """
+        the name of the base section of int or fp, like int=base=default=default.
+        """
+        return "%s=base=default=default" % (bench_name)
+
+    @staticmethod
+    def patch(lines, variables, values, first=0):
+        """
+        a copy of the lines of a section with the new values of the variables.
+        A missing variable is inserted at line first, i.e. after the section header.
+        """
+        new_lines = list(lines)
+        missing = []
+        for name, value in values.items():
+            line = "%-13s= %s\n" % (name, value)
+            if name in variables:
+                new_lines[variables[name]] = line
+            else:
+                missing.append(line)
+        new_lines[first:first] = missing
+        return new_lines
+
+    def render(self, overrides=None, options=None, keep_md5=True, sections=None):
+        """
+        the text of a config file with new values for some variables.
+        Args:
+            overrides (dict): {section name: {variable: value}}, e.g. {"456.hmmer=peak=default=default": {"COPTIMIZE": "-O3"}}.
+                A section which is not in the config file is added before the __MD5__ block.
+            options (dict): new values for the global options, like ext or check_md5
+            keep_md5 (bool): keep the __MD5__ block. It is useless for a new ext, since runspec only
+                matches the MD5 of the executables with the same ext.
+            sections (function): keep only the sections whose name it accepts, default is all of them
+        """
+        if overrides is None:
+            overrides = {}
+        if options:
+            texts = self.patch(self.header, self.header_variables, options)
+        else:
+            texts = [self.header_text]
+        for k, name in enumerate(self.section_names):
+            if sections is not None and not sections(name):
+                continue
+            if name in overrides and self.last_section[name] == k:
+                texts.extend(self.patch(self.sections[k], self.variables[k], overrides[name], 1))
+            else:
+                texts.append(self.texts[k])
+        for name, values in overrides.items():
+            if name not in self.last_section:
+                texts.append("%s:\n" % (name))
+                texts.extend(self.patch([], {}, values))
+                texts.append("\n")
+        if keep_md5:
+            texts.append(self.md5_text)
+        return "".join(texts)
+
+    def build_text(self, bench_no, bench_name, point_type, tune, overrides=None):
+        """
+        the text of the config file which the executables of a benchmark depend on: the global options but ext
+        and check_md5, and the sections which apply to the benchmark and tune, like default=default=default=default,
+        int=peak=default=default or 401.bzip2=default=default=default, with new values for some variables.
+        The __MD5__ block and the sections of the other benchmarks are left out.
+        """
+        benches = ["default", point_type, "%s.%s" % (bench_no, bench_name)]
+        def applies(name):
+            bench, section_tune = name.split("=")[:2]
+            return bench in benches and section_tune in ["default", tune]
+        return self.render(overrides, {"ext": "", "check_md5": ""}, keep_md5=False, sections=applies)
+
+    def wrap_compilers(self, launcher):
+        """
+        prefix the compilers (CC, CXX and FC) with a launcher like ccache, in the global options and in every section.
+        """
+        for lines, variables in [(self.header, self.header_variables)] + list(zip(self.sections, self.variables)):
+            for name in ["CC", "CXX", "FC"]:
+                i = variables.get(name)
+                if i is None:
+                    continue
+                value = lines[i].split("=", 1)[1].strip()
+                if not value.startswith(launcher + " "):
+                    lines[i] = "%-13s= %s %s\n" % (name, launcher, value)
+        self.texts = ["".join(lines) for lines in self.sections]
+        self.header_text = "".join(self.header)
+
+def get_compiler_identity(CFGLines):
+    """
+    a hash of the compilers (CC, CXX and FC) in the config file and their versions.
+    Args:
+        CFGLines (list): content of the config file
+    """
+    Identity = []
+    for Line in CFGLines:
+        m_compiler = re.search(r"^(CC|CXX|FC)\s*=\s*(\S+)", Line)
+        if m_compiler:
+            Compiler = m_compiler.group(2)
+            try:
+                p = subprocess.run([Compiler, "--version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+                Version = p.stdout.split("\n")[0]
+            except OSError:
+                Version = ""
+            Identity.append("%s=%s %s" % (m_compiler.group(1), Compiler, Version))
+    return hashlib.sha1("\n".join(Identity).encode()).hexdigest()
+
+def get_exe_dir(spec_dir, bench_no, bench_name):
+    """
+    the directory of the executables of a benchmark in the SPEC CPU 2006 installation.
+    """
+    return os.path.join(spec_dir, "benchspec", "CPU2006", "%s.%s" % (bench_no, bench_name), "exe")
+
+class build_cache(object):
+    """
+    a content-addressed cache of the executables of peak benchmarks.
+    The key is the benchmark number, the normalized flags, the compiler identity and the text of the config file the build depends on,
+    the least recently used entries are evicted when the cache is full.
+    """
+    def __init__(self, cache_dir, max_size):
+        """
+        Args:
+            cache_dir (str): the directory of the cache
+            max_size (float): the max size of the cache in bytes
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.index_file = os.path.join(cache_dir, "index.json")
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(bench_no, flags, compiler_id, cfg_text=""):
+        """
+        the cache key of the executables.
+        Args:
+            bench_no (str): the benchmark number
+            flags (dict): the flags for each flag name, like {"COPTIMIZE": ["-O2"]}
+            compiler_id (str): the compiler identity
+            cfg_text (str): the text of the config file the build depends on, see spec_cfg.build_text,
+                so that a change to PORTABILITY or EXTRA_LDFLAGS is built again
+        """
+        normalized = {}
+        for flag_name, flag in flags.items():
+            normalized[flag_name] = " ".join(" ".join(flag).split())
+        content = json.dumps([bench_no, normalized, compiler_id, hashlib.sha1(cfg_text.encode()).hexdigest()], sort_keys=True)
+        return "%s-%s" % (bench_no, hashlib.sha1(content.encode()).hexdigest())
+
+    def load_index(self):
+        if os.path.exists(self.index_file):
+            return load_json(self.index_file)
+        return {}
+
+    def restore(self, key, exe_dir, ext):
+        """
+        copy the cached executables to the exe directory, with the given ext.
+        Returns:
+            bool: True if the key is in the cache.
+        """
+        with locked_file(self.index_file):
+            index = self.load_index()
+            entry_dir = os.path.join(self.cache_dir, key)
+            if key not in index or not os.path.isdir(entry_dir):
+                return False
+            os.makedirs(exe_dir, exist_ok=True)
+            for exe in os.listdir(entry_dir):
+                shutil.copy2(os.path.join(entry_dir, exe), os.path.join(exe_dir, "%s.%s" % (exe, ext)))
+            index[key]["last_used"] = time.time()
+            dump_json(index, self.index_file)
+        Logger.info("Reusing the cached executables %s", key)
+        return True
+
+    def store(self, key, exe_dir, tune, ext):
+        """
+        copy the executables built with the given tune and ext into the cache.
+        Returns:
+            bool: True if any executable is stored.
+        """
+        suffix = ".%s" % (ext)
+        exes = glob.glob(os.path.join(exe_dir, "*_%s%s" % (tune, suffix)))
+        if len(exes) == 0:
+            Logger.error("Cannot find any executable in %s to cache.", exe_dir)
+            return False
+        with locked_file(self.index_file):
+            index = self.load_index()
+            entry_dir = os.path.join(self.cache_dir, key)
+            tmp_dir = "%s.tmp.%d" % (entry_dir, os.getpid())
+            os.makedirs(tmp_dir, exist_ok=True)
+            size = 0
+            for exe in exes:
+                exe_name = os.path.basename(exe)[:-len(suffix)]
+                shutil.copy2(exe, os.path.join(tmp_dir, exe_name))
+                size += os.path.getsize(exe)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.rename(tmp_dir, entry_dir)
+            index[key] = {"size": size, "last_used": time.time()}
+            self.evict(index)
+            dump_json(index, self.index_file)
+        Logger.info("Stored the executables in the build cache as %s", key)
+        return True
+
+    def evict(self, index):
+        """
+        remove the least recently used entries until the cache fits in max_size.
+        """
+        total = sum([entry["size"] for entry in index.values()])
+        for key in sorted(index.keys(), key=lambda k: index[k]["last_used"]):
+            if total <= self.max_size:
+                break
+            total -= index[key]["size"]
+            del index[key]
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            Logger.info("Evicted %s from the build cache", key)
+
+def get_cpu_sets(num_sets, cpus_per_set=0):
+    """
+    split the cpus available to this process into disjoint cpu sets.
+    Args:
+        num_sets (int): the number of cpu sets
+        cpus_per_set (int): the number of cpus in each set, 0 means splitting all the cpus evenly.
+    Returns:
+        list: a list of cpu lists, like "0-7" or "8,9,10", which could be passed to taskset.
+    """
+    cpus = sorted(os.sched_getaffinity(0))
+    if cpus_per_set <= 0:
+        cpus_per_set = len(cpus) // num_sets
+    if cpus_per_set == 0 or cpus_per_set * num_sets > len(cpus):
+        Logger.error("Cannot split %d cpus into %d sets with %d cpus each.", len(cpus), num_sets, cpus_per_set)
+        exit(1)
+    cpu_sets = []
+    for i in range(num_sets):
+        cpu_set = cpus[i*cpus_per_set:(i+1)*cpus_per_set]
+        cpu_sets.append(",".join([str(cpu) for cpu in cpu_set]))
+    return cpu_sets
+
+def KeepFlags(OldScore, NewScore, KBT, rng=random):
     """
     using a Monte Carlo method to determine whether to keep the current flags or not.
     the basin hopping method.
+    Args:
+        rng (random.Random): the random number generator, default is the global one.
     """
     deltaScore = NewScore - OldScore
     if deltaScore >= 0:
         return True
     if deltaScore < 0:
-        P = random.random()
+        P = rng.random()
         if math.exp(deltaScore/KBT) > P:
             return True
         else:
             return False
 
-def update_cfg_lines(old_cfg_lines, opt_flag_names, cfg_struct, flags):
-    """generate the new config lines according to the new flags.
-
-    Args:
-        old_cfg_lines (list): a list of the original cfg lines
-        benchmark (str): the name of the benchmark
-        cfg_struct (dict)): a dict about the struct of the config file.
-        flags (list): new optimization flags for spec cpu
-    """
-    Logger.info("Generating the new config file.")
-    new_cfg_lines = copy.deepcopy(old_cfg_lines)
-    for i, flag_type in enumerate(opt_flag_names):
-        flag_line = "%s = %s\n" %(flag_type, " ".join(flags[i]))
-        Logger.info(flag_line)
-        line_num = cfg_struct[flag_type]
-        new_cfg_lines[line_num] = flag_line
-    return new_cfg_lines
-
 def get_config_file(log_lines):
     """get the name of the config file according to the log_lines
 
     Args:
         log_lines ([list]): [a list of the log lines]
     """
-    for line in log_lines:
-        m = re.search(r"Reading config file '(.*)'", line)
-        if m:
-            return m.group(1)
-    else:
+    config_file = spec_log.from_lines(log_lines).config_file
+    if not config_file:
         Logger.error("Failed to find the name of the config file.")
-        return ""
+    return config_file
 
 def get_log_name(out_lines):
     """"get the name of logfile from the out put of spec 2006"
@@ -553,24 +1212,15 @@ def get_log_name(out_lines):
     Args:
         out ([list]): list of lines in the output
     """
-    for line in out_lines:
-        m1 = re.search(r"^logname\s+=\s+(.*)$", line)
-        m2 = re.search(r"The log for this run is in (.*)$", line)
-        if m1:
-            return m1.group(1)
-        elif m2:
-            return m2.group(1)
-    else:
+    log_name = spec_log.from_lines(out_lines).log_name
+    if not log_name:
         Logger.error("Cannot get the logname from the output")
-        return ""
+    return log_name
 
 def parse_log_file(log_file):
     """main function of this program.
     """
-    with open(log_file, "r") as fp:
-        log_lines = fp.readlines()
-        fp.close()
-    Res = ExtractResFromLog(log_lines)
+    Res = spec_log.from_file(log_file).result
     base_int_res = filter_res(Res, "base", "ref", "int")
     base_fp_res = filter_res(Res, "base", "ref", "fp")
     peak_int_res = filter_res(Res, "peak", "ref", "int")
@@ -586,40 +1236,375 @@ def parse_log_file(log_file):
     Logger.info("\nBaseInt = %.2f\nBaseFP = %.2f\nPeakInt = %.2f\nPeakFP = %.2f",
                 BaseInt, BaseFP, PeakInt, PeakFP)
 
-def run_spec(config, bench_name):
-    """[a function that call runspec program to run spec cpu]
+async def stream_cmd(cmd, parser):
+    """run a command and feed its stdout and stderr to the parser line by line as they arrive.
+
+    Args:
+        cmd (list): the command
+        parser (spec_output_parser): the parser of the output
+    Returns:
+        spec_output_parser: the parser, with the return code of the command.
+    """
+    Logger.info("Running with cmd %s", cmd)
+    start = time.monotonic()
+    proc = await asyncio.create_subprocess_exec(*cmd,
+                                                stdout=asyncio.subprocess.PIPE,
+                                                stderr=asyncio.subprocess.PIPE,
+                                                start_new_session=True,
+                                                # runspec keeps ignoring SIGPIPE like python, so that it finishes its
+                                                # run and its log if AutoSPEC dies, see spec_job.resume.
+                                                restore_signals=False,
+                                                limit=2**20)
+    parser.proc = proc
+    if parser.on_start is not None:
+        parser.on_start(proc)
+    async def pump(stream):
+        parse_time = 0.0
+        while True:
+            line = await stream.readline()
+            if not line:
+                break
+            t = time.perf_counter()
+            parser.feed(line.decode(errors="replace").rstrip("\n"))
+            parse_time += time.perf_counter() - t
+        parser.timer.add("parse", parse_time)
+    async def watch():
+        while True:
+            await asyncio.sleep(CutoffInterval)
+            parser.check_cutoff()
+    watcher = asyncio.ensure_future(watch())
+    try:
+        await asyncio.gather(pump(proc.stdout), pump(proc.stderr))
+        parser.returncode = await proc.wait()
+    finally:
+        watcher.cancel()
+    end = time.monotonic()
+    if parser.run_started is not None and parser.run_started >= start:
+        parser.timer.add("build", parser.run_started - start)
+        parser.timer.add("run", end - parser.run_started)
+    else:
+        parser.timer.add("build", end - start)
+    return parser
+
+def runspec_cmd(config, bench_name, config_file=None, cpus=None, action=None, bench_size=None):
+    """[the command line to run spec cpu]
 
     Args:
         config ([param]): [the configuration for spec 2006]
+        bench_name (str): the benchmark to run, or a list of benchmarks to run in one call
+        config_file (str): the config file to use, default is config.config_file
+        cpus (str): pin runspec and all its children to these cpus with taskset, like "0,1,2,3"
+        action (str): "build" only builds the benchmark, "run" runs the existing executables without building.
+        bench_size (str): test, train or ref, default is config.bench_size
     """
-    cmd = ["runspec", 
-            "--config", config.config_file,
+    if config_file is None:
+        config_file = config.config_file
+    if bench_size is None:
+        bench_size = config.bench_size
+    if isinstance(bench_name, list):
+        benchmarks = bench_name
+    else:
+        benchmarks = [bench_name]
+    cmd = [config.runspec,
+            "--config", config_file,
             "--tune", config.tune,
             "-C", "%d" %(config.copies),
             "--iterations", "%d" %(config.iterations),
-            "-i", config.bench_size,
+            "-i", bench_size,
             "--noreportable",
             "--ignoreerror",
-            bench_name
-            ]
-    Logger.info("Running with cmd %s", cmd)
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    out, err = p.communicate()
-    return out, err
+            ] + benchmarks
+    if action == "build":
+        cmd[1:1] = ["--action", "build"]
+    elif action == "run":
+        cmd[1:1] = ["--action", "run", "--nobuild"]
+    if config.resource_usage:
+        cmd = [sys.executable, UsageWrapper] + cmd
+    if cpus is not None:
+        cmd = ["taskset", "-c", cpus] + cmd
+    return cmd
+
+def run_spec(config, bench_name, config_file=None, cpus=None, parser=None):
+    """[a function that call runspec program to run spec cpu]
+
+    Args:
+        config ([param]): [the configuration for spec 2006]
+        bench_name (str): the benchmark to run
+        config_file (str): the config file to use, default is config.config_file
+        cpus (str): pin runspec and all its children to these cpus with taskset
+        parser (spec_output_parser): the parser for the output, with the callbacks
+    Returns:
+        spec_output_parser: the parsed output
+    """
+    if parser is None:
+        parser = spec_output_parser()
+    cmd = runspec_cmd(config, bench_name, config_file, cpus)
+    return asyncio.run(stream_cmd(cmd, parser))
+
+class remote_task(object):
+    """
+    a candidate config waiting for, or running on, a worker.
+    """
+    def __init__(self, task_id, spec, parser):
+        """
+        Args:
+            task_id (str): the id of the task
+            spec (dict): the config file and the runspec options sent to the worker
+            parser (spec_output_parser): collects the parsed output sent back by the worker
+        """
+        self.task_id = task_id
+        self.spec = spec
+        self.parser = parser
+        self.lease = None
+        self.worker = None
+        self.deadline = None
+        self.attempts = 0
+        self.worker_time = 0.0
+        self.done = threading.Event()
+
+class coordinator_handler(BaseHTTPRequestHandler):
+    """
+    the HTTP interface of spec_coordinator, every request and reply is a JSON object.
+    """
+    def do_POST(self):
+        coordinator = self.server.coordinator
+        if coordinator.token and self.headers.get("X-AutoSPEC-Token") != coordinator.token:
+            self.reply(403)
+            return
+        coordinator.last_seen = time.monotonic()
+        handlers = {"/lease": coordinator.lease,
+                    "/heartbeat": coordinator.heartbeat,
+                    "/event": coordinator.event,
+                    "/complete": coordinator.complete}
+        if self.path not in handlers:
+            self.reply(404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.reply(400)
+            return
+        code, body = handlers[self.path](request)
+        self.reply(code, body)
+
+    def reply(self, code, body=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        Logger.debug("%s %s", self.address_string(), format % args)
+
+class spec_coordinator(object):
+    """
+    hand out the candidate configs to the workers on other machines and collect their parsed results.
+    The workers pull the tasks over HTTP, see AutoSPECWorker.py:
+        POST /lease      {"worker"}                            -> a task, or 204 if there is none
+        POST /heartbeat  {"task_id", "lease"}                  -> 200, or 410 if the lease is lost
+        POST /event      {"task_id", "lease", "kind", "data"}  the log name, each result and each build error
+        POST /complete   {"task_id", "lease", "returncode", "dominated", "log_name", "result", "build_errors", "timing"}
+    A task whose worker stops sending heartbeats is given to another worker, up to max_attempts times.
+    Once all the workers are gone, each lease_timeout a task waits in the queue counts as another attempt,
+    while before the first worker comes the tasks wait for it.
+    """
+    def __init__(self, address, lease_timeout=60.0, max_attempts=3, token=""):
+        """
+        Args:
+            address (str): the address to listen on, like 0.0.0.0:8426
+            lease_timeout (float): the seconds without a heartbeat after which a task is re-queued
+            max_attempts (int): the number of workers a task is given to before it fails
+            token (str): a shared secret the workers send in the X-AutoSPEC-Token header
+        """
+        host, port = address.rsplit(":", 1)
+        self.address = (host, int(port))
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.token = token
+        self.lock = threading.Lock()
+        self.queue = []
+        self.tasks = {}
+        self.server = None
+        # the last time any worker sent a request, the idle workers ask for a lease every few seconds.
+        self.last_seen = None
+
+    def start(self):
+        """
+        start serving the workers in a background thread.
+        """
+        self.server = ThreadingHTTPServer(self.address, coordinator_handler)
+        self.server.daemon_threads = True
+        self.server.coordinator = self
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        Logger.info("The coordinator is listening on %s:%d", *self.server.server_address[:2])
+
+    def submit(self, spec, parser):
+        """
+        queue a task for the workers.
+        """
+        if self.server is None:
+            self.start()
+        task = remote_task(uuid.uuid4().hex, spec, parser)
+        task.deadline = time.monotonic() + self.lease_timeout
+        with self.lock:
+            self.tasks[task.task_id] = task
+            self.queue.append(task.task_id)
+        return task
+
+    async def run(self, spec, parser):
+        """
+        queue a task and wait until a worker completes it.
+        Returns:
+            spec_output_parser: the parser with the output of the worker
+        """
+        start = time.perf_counter()
+        task = self.submit(spec, parser)
+        await asyncio.get_running_loop().run_in_executor(None, self.wait, task)
+        with self.lock:
+            del self.tasks[task.task_id]
+        parser.timer.add("wait", max(0.0, time.perf_counter() - start - task.worker_time))
+        return parser
+
+    def wait(self, task):
+        """
+        wait until a task is completed or fails. The expired leases are checked meanwhile, since no lease
+        request comes in when all the workers are gone.
+        """
+        while not task.done.wait(self.lease_timeout/3):
+            with self.lock:
+                self.requeue_expired()
+
+    def requeue_expired(self):
+        """
+        put the tasks of the workers which stopped sending heartbeats back to the queue, and count the time the
+        queued tasks wait after all the workers are gone as attempts. Called with the lock held.
+        """
+        now = time.monotonic()
+        for task in self.tasks.values():
+            if task.done.is_set() or task.deadline > now:
+                continue
+            if task.lease is not None:
+                Logger.warning("Worker %s lost task %s", task.worker, task.task_id)
+                task.lease = None
+                task.parser.log_name = ""
+                task.parser.result = []
+                task.parser.build_errors = []
+            elif self.last_seen is not None and self.last_seen + self.lease_timeout <= now:
+                # a task waiting in the queue, with no worker left to run it.
+                Logger.warning("No worker is left to run task %s", task.task_id)
+                task.attempts += 1
+                self.queue.remove(task.task_id)
+            else:
+                continue
+            if task.attempts >= self.max_attempts:
+                Logger.error("Task %s failed after %d attempts, giving up.", task.task_id, task.attempts)
+                task.done.set()
+            else:
+                task.deadline = now + self.lease_timeout
+                self.queue.append(task.task_id)
+
+    def find_lease(self, request):
+        """
+        the task of a request, or None if the lease of the worker is no longer valid. Called with the lock held.
+        """
+        task = self.tasks.get(request.get("task_id"))
+        if task is None or task.lease is None or task.lease != request.get("lease"):
+            return None
+        return task
+
+    def lease(self, request):
+        with self.lock:
+            self.requeue_expired()
+            if len(self.queue) == 0:
+                return 204, None
+            task = self.tasks[self.queue.pop(0)]
+            task.lease = uuid.uuid4().hex
+            task.worker = request.get("worker", "")
+            task.deadline = time.monotonic() + self.lease_timeout
+            task.attempts += 1
+        Logger.info("Task %s is running on worker %s", task.task_id, task.worker)
+        reply = dict(task.spec)
+        reply["task_id"] = task.task_id
+        reply["lease"] = task.lease
+        reply["heartbeat"] = self.lease_timeout/3
+        return 200, reply
 
-def run_fake_spec(config, bench_name):
+    def heartbeat(self, request):
+        with self.lock:
+            task = self.find_lease(request)
+            if task is None:
+                return 410, None
+            task.deadline = time.monotonic() + self.lease_timeout
+        return 200, {}
+
+    def event(self, request):
+        with self.lock:
+            task = self.find_lease(request)
+            if task is None:
+                return 410, None
+            task.deadline = time.monotonic() + self.lease_timeout
+            parser = task.parser
+            kind = request.get("kind")
+            data = request.get("data")
+            if kind == "log_name":
+                parser.log_name = data
+                callback = parser.on_log_name
+                args = [data]
+            elif kind == "result":
+                parser.result.append(data)
+                callback = parser.on_result
+                args = [data]
+            elif kind == "build_error":
+                parser.build_errors.append(tuple(data))
+                callback = parser.on_build_error
+                args = data
+            else:
+                return 400, None
+        if callback is not None:
+            callback(*args)
+        return 200, {}
+
+    def complete(self, request):
+        with self.lock:
+            task = self.find_lease(request)
+            if task is None:
+                return 410, None
+            task.lease = None
+            # the events may have been lost on the way, the completion has the whole output.
+            parser = task.parser
+            parser.returncode = request.get("returncode")
+            parser.dominated = request.get("dominated", False)
+            parser.log_name = request.get("log_name", parser.log_name)
+            parser.result = request.get("result", parser.result)
+            parser.build_errors = [tuple(bench) for bench in request.get("build_errors", parser.build_errors)]
+            # the log is on the worker, so are the compile times in it.
+            add_usage(parser.usage, request.get("usage", {}))
+            parser.compile_times = request.get("compile_times", {})
+            timing = request.get("timing", {})
+            for name, seconds in timing.items():
+                parser.timer.add(name, seconds)
+            task.worker_time = sum(timing.values())
+            task.done.set()
+        Logger.info("Task %s is completed by worker %s", task.task_id, task.worker)
+        return 200, {}
+
+def run_fake_spec(config, bench_name, parser=None):
     """
-    Just a fake function, pretending that run_spec function is called.
+    Just a fake function, pretending that run_spec function is called, see FakeRunSpec.py.
     Args:
-        config (_type_): _description_
-        bench_name (_type_): _description_
+        config (param): the configuration for spec 2006
+        bench_name (str): the benchmark to run
     """
-    log_name = "CPU2006.113.log"
-    cmd = ["cat", log_name]
-    Logger.info("Running with cmd %s", cmd)
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    out, err = p.communicate()
-    return out, err
+    if parser is None:
+        parser = spec_output_parser()
+    cmd = runspec_cmd(config, bench_name)
+    i = cmd.index(config.runspec)
+    cmd[i:i+1] = [sys.executable, os.path.join(config.program_dir, "FakeRunSpec.py")]
+    return asyncio.run(stream_cmd(cmd, parser))
 
 def find_best_job(jobs, tune, bench_name, bench_size):
     """find the job with the highest score in the jobs list
@@ -665,7 +1650,7 @@ def find_last_job(jobs, tune, bench_name, bench_size):
         bench_size (str): the size of the benchmark
     """
     num_jobs = len(jobs)
-    for i in range(num_jobs-1, 0, -1):
+    for i in range(num_jobs-1, -1, -1):
         job = jobs[i]
         if job["benchmark_name"] == bench_name and job["bench_size"] == bench_size and job["tune"] == tune:
             return i
@@ -683,51 +1668,857 @@ def is_empty_flags(flags):
             return False
     return True
     
-def get_peak_flags(jobs, tune, bench_name, bench_size, langs):
-    """get the peak flags in the jobs
-
-    Args:
-        jobs (list): a list of jobs. 
+def flag_family(flag):
+    """the family of a flag: the flags in the same family override each other and the last one wins.
+    For example, -O2 and -O3, -fpeel-loops and -fno-peel-loops, -falign-functions=32 and -falign-functions=64.
     """
-    idx = find_best_job(jobs, tune, bench_name, bench_size)
-    if idx is None:
-        flags = []
-        for lang in langs:
-            flags.append([])
-        return flags
-    else:
-        return jobs[idx]["gcc_flags"]
+    if flag.startswith("-O"):
+        return "-O"
+    m = re.search(r"^-([fmW])(no-)?([^=]+)(=.*)?$", flag)
+    if m:
+        return "-%s%s%s" % (m.group(1), m.group(3), "=" if m.group(4) else "")
+    return flag
+
+def canonical_flags(flags):
+    """the canonical form of the flags of each language, so that equivalent flag lists get the same key.
+    Only the last flag of each family is kept and the flags are sorted.
 
-def get_next_option(flags, options):
-    """ get the next option according to current flags.
     Args:
-        flags ([type]): [description]
-        options ([type]): [description]
+        flags (list): a list of flag lists, one for each language
     Returns:
-        (int, str): 
+        tuple: a tuple of flag tuples
     """
-    if len(flags[0]) == 0:
-        return (0, options[0])
-    else:
-        last_option = options[-1]
-        for i, flag in enumerate(flags):
-            last_flag = flag[-1]
-            if last_flag == last_option:
-                continue
-            else:
-                for j, option in enumerate(options):
-                    if last_flag == option:
-                        return (i, options[j+1])
-    return (None, None)
+    canonical = []
+    for flag in flags:
+        last = {}
+        for option in " ".join(flag).split():
+            last[flag_family(option)] = option
+        canonical.append(tuple(sorted(last.values())))
+    return tuple(canonical)
 
-def get_bench_number_name(tune, mystr):
-    """get the benchmark number and name from the given string
+def override_flags(flags):
+    """the flags of one language with only the last flag of each family, in their order, as the compiler reads them.
+    """
+    last = {}
+    for k, flag in enumerate(flags):
+        last[flag_family(flag)] = k
+    return [flag for k, flag in enumerate(flags) if last[flag_family(flag)] == k]
 
-    Returns:
-        point_type, benchmark number, benchmark name
+class option_model(object):
     """
-    if tune == "peak":
-        for point_type, v in Benchmarks.items():
+    the compiler options and the relations between them.
+    The option file is either a list of flags, or a list of dicts with name, requires, conflicts and implies, like options.json.
+    An option may also have langs, the languages it applies to, like ["Fortran"]; by default it applies to all of them.
+    """
+    def __init__(self, option_file, rules_file=None):
+        """
+        Args:
+            option_file (str): the file of the options to search
+            rules_file (str): a structured file with more relations, its flags are not added to the options
+        """
+        self.names = []
+        self.requires = {}
+        self.conflicts = {}
+        self.implies = {}
+        self.langs = {}
+        self.closures = {}
+        self.load(option_file, True)
+        if rules_file is not None:
+            self.load(rules_file, False)
+
+    def load(self, option_file, add_names):
+        """
+        load the options and their relations from a file.
+        """
+        for item in load_json(option_file):
+            if isinstance(item, str):
+                item = {"name": item}
+            name = item["name"].strip()
+            if len(name) == 0:
+                continue
+            if add_names and name not in self.names:
+                self.names.append(name)
+            self.requires.setdefault(name, set()).update([flag.strip() for flag in item.get("requires", [])])
+            self.implies.setdefault(name, set()).update([flag.strip() for flag in item.get("implies", [])])
+            if "langs" in item:
+                self.langs[name] = set(item["langs"])
+            for flag in item.get("conflicts", []):
+                self.conflicts.setdefault(name, set()).add(flag.strip())
+                self.conflicts.setdefault(flag.strip(), set()).add(name)
+        self.closures = {}
+
+    def options_for(self, lang):
+        """
+        the options which apply to a language, in the order of the option file.
+        """
+        return [name for name in self.names if lang in self.langs.get(name, [lang])]
+
+    def closure(self, flag):
+        """
+        all the flags implied by the flag, directly or indirectly.
+        """
+        if flag not in self.closures:
+            closure = set()
+            stack = list(self.implies.get(flag, []))
+            while len(stack) > 0:
+                implied = stack.pop()
+                if implied not in closure and implied != flag:
+                    closure.add(implied)
+                    stack.extend(self.implies.get(implied, []))
+            self.closures[flag] = closure
+        return self.closures[flag]
+
+    def defaults(self, flag):
+        """
+        the flags of the closure which any explicit flag of their family overrides, wherever it is.
+        The -O levels only set defaults, the other flags set their implied flags where they are, and the last flag wins.
+        """
+        if flag_family(flag) == "-O":
+            return self.closure(flag)
+        return set()
+
+    def normalize(self, flags):
+        """
+        remove the overridden flags, the duplicate flags of one language and the flags implied by the others, the later flags first.
+        A flag is overridden by a later flag of its family, or by a later flag which implies a flag of its family, like -fsigned-zeros before -ffast-math.
+        Returns:
+            (list, list): the remaining flags, and the removed ones as (flag, kind, other flag)
+        """
+        kept = []
+        removed = []
+        for k, flag in enumerate(flags):
+            if flag in flags[k+1:]:
+                removed.append((flag, "duplicate", flag))
+            else:
+                kept.append(flag)
+        effective = override_flags(kept)
+        for k, flag in enumerate(kept):
+            later = [other for other in kept[k+1:] if other in effective]
+            if flag not in effective:
+                overrider = [other for other in later if flag_family(other) == flag_family(flag)]
+                removed.append((flag, "overridden", overrider[-1]))
+                continue
+            for other in later:
+                implied = self.closure(other) - self.defaults(other)
+                if flag not in implied and flag_family(flag) in [flag_family(f) for f in implied]:
+                    removed.append((flag, "overridden", other))
+                    effective.remove(flag)
+                    break
+        kept = effective
+        k = len(kept) - 1
+        while k >= 0:
+            flag = kept[k]
+            others = kept[:k] + kept[k+1:]
+            implier = [other for other in others if flag in self.closure(other)]
+            closure = self.closure(flag)
+            coverage = set(others)
+            for other in others:
+                coverage.update(self.closure(other))
+            if len(implier) > 0:
+                removed.append((flag, "implied", implier[0]))
+            elif len(closure) > 0 and closure <= coverage:
+                removed.append((flag, "implied", " ".join(sorted(closure))))
+            else:
+                k -= 1
+                continue
+            # the closures are transitive, what the removed flag covered is still covered by the flag implying it.
+            del kept[k]
+            k -= 1
+        return kept, removed
+
+    def check(self, flags):
+        """
+        check the flags of one language.
+        The flags implied by the others count as explicit flags, except the defaults of the -O levels.
+        Returns:
+            list: the problems as (flag, kind, other flag), kind is conflict, requires, duplicate or implied.
+        """
+        problems = []
+        for k, flag in enumerate(flags):
+            others = [other for other in flags[:k] + flags[k+1:] if other != flag]
+            if flag in flags[:k]:
+                problems.append((flag, "duplicate", flag))
+                continue
+            coverage = set(others)
+            for other in others:
+                coverage.update(self.closure(other))
+            for other in others:
+                implied = self.closure(other) - self.defaults(other) - set([flag])
+                for other_flag in [other] + sorted(implied):
+                    if other_flag in self.conflicts.get(flag, []):
+                        problems.append((flag, "conflict", other))
+                        break
+                    elif flag_family(other_flag) == flag_family(flag) and flag_family(flag) != "-O":
+                        # like -fpeel-loops and -fno-peel-loops, or -fmath-errno and -ffast-math
+                        problems.append((flag, "conflict", other))
+                        break
+            for required in self.requires.get(flag, []):
+                if required not in coverage:
+                    problems.append((flag, "requires", required))
+            closure = self.closure(flag)
+            if flag in coverage:
+                implier = [other for other in others if flag in self.closure(other)]
+                problems.append((flag, "implied", implier[0] if len(implier) > 0 else flag))
+            elif len(closure) > 0 and closure <= coverage:
+                problems.append((flag, "implied", " ".join(sorted(closure))))
+        return problems
+
+class job_index(object):
+    """
+    an in-memory index over the jobs, built once when the jobs are loaded and updated as jobs are appended.
+    It answers the same questions as find_best_job and find_last_job in O(1), and finds the job which already measured a flag set.
+    """
+    def __init__(self, jobs=None):
+        self.rebuild([] if jobs is None else jobs)
+
+    def rebuild(self, jobs):
+        """
+        index all the jobs again, after some jobs are replaced.
+        """
+        self.num_jobs = 0
+        self.by_flags = {}
+        self.best = {}
+        self.last = {}
+        self.sync(jobs)
+
+    @staticmethod
+    def flags_key(tune, bench_size, bench_name, flags):
+        return (tune, bench_size, bench_name, canonical_flags(flags))
+
+    def sync(self, jobs):
+        """
+        add the jobs which are not indexed yet, the jobs list could only grow at the end.
+        """
+        for i in range(self.num_jobs, len(jobs)):
+            self.add(jobs[i], i)
+        self.num_jobs = len(jobs)
+
+    def add(self, job, idx):
+        """
+        index a job.
+        Args:
+            job (dict): the job
+            idx (int): the index of the job in the jobs list
+        """
+        tune = job["tune"]
+        bench_name = job["benchmark_name"]
+        bench_size = job["bench_size"]
+        self.by_flags[self.flags_key(tune, bench_size, bench_name, job["gcc_flags"])] = idx
+        self.last[(tune, bench_name, bench_size)] = idx
+        if tune == "base":
+            if bench_size == "ref":
+                self.update_best((tune, bench_name, bench_size), job["final_score"], idx)
+            return
+        for r in job["result"]:
+            key = (r["Tune"], bench_name, r["BenchSize"])
+            if r["Tune"] != "peak":
+                continue
+            if r["BenchSize"] == "ref":
+                self.update_best(key, job["final_score"], idx)
+            elif r["BenchSize"] in ["train", "test"]:
+                self.update_best(key, -r["RunTime"], idx)
+
+    def update_best(self, key, value, idx):
+        """
+        keep the job with the largest value as the incumbent, the first one wins a tie like find_best_job.
+        """
+        if key not in self.best:
+            if value > 0.0 or key[2] != "ref":
+                self.best[key] = (value, idx)
+        elif value > self.best[key][0]:
+            self.best[key] = (value, idx)
+
+    def find_best_job(self, tune, bench_name, bench_size):
+        """the index of the job with the highest score, see find_best_job.
+        """
+        if (tune, bench_name, bench_size) in self.best:
+            return self.best[(tune, bench_name, bench_size)][1]
+        return None
+
+    def find_last_job(self, tune, bench_name, bench_size):
+        """the index of the last job for the given benchmark, see find_last_job.
+        """
+        return self.last.get((tune, bench_name, bench_size))
+
+    def find_job(self, tune, bench_size, bench_name, flags):
+        """the index of the job which already measured the given flags, or None.
+        """
+        return self.by_flags.get(self.flags_key(tune, bench_size, bench_name, flags))
+
+class json_job_store(object):
+    """
+    the jobs in one json file, which is rewritten after each run.
+    All the job stores keep the loaded jobs and a job_index in memory, and only read the jobs written by other processes.
+    """
+    def __init__(self, jobs_file):
+        """
+        Args:
+            jobs_file (str): the name of the jobs file
+        """
+        self.jobs_file = jobs_file
+        self.jobs = []
+        self.positions = {}
+        self.replaced = False
+        self.index = job_index()
+        # the mtime and size of the jobs file when this process last read or wrote it.
+        self.version = None
+
+    def file_version(self):
+        """
+        the mtime and size of the jobs file, or None if it does not exist.
+        """
+        try:
+            st = os.stat(self.jobs_file)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def check_version(self):
+        """
+        another process may have rewritten a job in place, rebuild the index if the file changed since the last read.
+        """
+        version = self.file_version()
+        if self.version is not None and version != self.version:
+            self.replaced = True
+        self.version = version
+
+    def load(self):
+        """
+        load the jobs from the file.
+        Returns:
+            list: all the jobs
+        """
+        if os.path.exists(self.jobs_file):
+            self.check_version()
+            self.jobs = load_json(self.jobs_file)
+        self.sync_index()
+        return self.jobs
+
+    def append(self, new_jobs):
+        """
+        append new jobs to the store.
+        Returns:
+            list: all the jobs, including the ones appended by other processes.
+        """
+        with locked_file(self.jobs_file):
+            self.check_version()
+            jobs = load_json(self.jobs_file) if os.path.exists(self.jobs_file) else []
+            jobs.extend(new_jobs)
+            dump_json(jobs, self.jobs_file)
+            self.version = self.file_version()
+        self.jobs = jobs
+        self.sync_index()
+        return self.jobs
+
+    def update(self, job):
+        """
+        replace a job with the same job_id, like a job with more repetitions.
+        Returns:
+            list: all the jobs
+        """
+        with locked_file(self.jobs_file):
+            jobs = load_json(self.jobs_file)
+            for i, old_job in enumerate(jobs):
+                if old_job.get("job_id") == job["job_id"]:
+                    jobs[i] = job
+            dump_json(jobs, self.jobs_file)
+            self.version = self.file_version()
+        self.jobs = jobs
+        self.index.rebuild(self.jobs)
+        return self.jobs
+
+    def sync_index(self):
+        """
+        update the index after reading the store.
+        """
+        if self.replaced:
+            self.index.rebuild(self.jobs)
+            self.replaced = False
+        else:
+            self.index.sync(self.jobs)
+
+    def import_jobs(self, json_file):
+        """
+        import the jobs from a jobs.json file.
+        """
+        jobs = load_json(json_file)
+        for job in jobs:
+            if "job_id" not in job:
+                job["job_id"] = uuid.uuid4().hex
+        Logger.info("Importing %d jobs from %s to %s", len(jobs), json_file, self.jobs_file)
+        self.append(jobs)
+
+    def compact(self):
+        """
+        compact the job store.
+        """
+        with locked_file(self.jobs_file):
+            dump_json(self.load(), self.jobs_file)
+
+    def add_record(self, job):
+        """
+        add a job read from the store to the memory, a job with the same job_id replaces the old one.
+        """
+        job_id = job.get("job_id")
+        if job_id is not None and job_id in self.positions:
+            self.jobs[self.positions[job_id]] = job
+            self.replaced = True
+        else:
+            if job_id is not None:
+                self.positions[job_id] = len(self.jobs)
+            self.jobs.append(job)
+
+class jsonl_job_store(json_job_store):
+    """
+    an append-only JSON Lines log of the jobs, one job per line.
+    """
+    def __init__(self, jobs_file, legacy_file=None):
+        """
+        Args:
+            jobs_file (str): the name of the jsonl file
+            legacy_file (str): a jobs.json file to import when the jsonl file does not exist
+        """
+        super().__init__(jobs_file)
+        self.offset = 0
+        if not os.path.exists(jobs_file) and legacy_file is not None and os.path.exists(legacy_file):
+            self.import_jobs(legacy_file)
+
+    def read_new(self):
+        """
+        read the jobs appended since the last read, an incomplete last line is left for the next read.
+        """
+        if not os.path.exists(self.jobs_file):
+            return
+        with open(self.jobs_file, "rb") as fp:
+            fp.seek(self.offset)
+            for line in fp:
+                if not line.endswith(b"\n"):
+                    break
+                self.offset += len(line)
+                if line.strip():
+                    self.add_record(json.loads(line))
+        self.sync_index()
+
+    def load(self):
+        self.read_new()
+        return self.jobs
+
+    def append(self, new_jobs):
+        with locked_file(self.jobs_file):
+            self.read_new()
+            with open(self.jobs_file, "a") as fp:
+                for job in new_jobs:
+                    fp.write(json.dumps(job) + "\n")
+                fp.flush()
+                os.fsync(fp.fileno())
+            self.read_new()
+        return self.jobs
+
+    def update(self, job):
+        """
+        append the new version of the job, which replaces the old one when the log is read.
+        """
+        return self.append([job])
+
+    def compact(self):
+        """
+        rewrite the log with only the latest version of each job.
+        """
+        with locked_file(self.jobs_file):
+            self.read_new()
+            tmp_file = "%s.tmp.%d" % (self.jobs_file, os.getpid())
+            with open(tmp_file, "w") as fp:
+                for job in self.jobs:
+                    fp.write(json.dumps(job) + "\n")
+            os.replace(tmp_file, self.jobs_file)
+            self.offset = os.path.getsize(self.jobs_file)
+        Logger.info("Compacted %s to %d jobs", self.jobs_file, len(self.jobs))
+
+class sqlite_job_store(json_job_store):
+    """
+    the jobs in a sqlite database, indexed by benchmark, tune and size.
+    """
+    def __init__(self, jobs_file, legacy_file=None):
+        """
+        Args:
+            jobs_file (str): the name of the sqlite database
+            legacy_file (str): a jobs.json file to import when the database does not exist
+        """
+        super().__init__(jobs_file)
+        self.last_rev = 0
+        is_new = not os.path.exists(jobs_file)
+        self.conn = sqlite3.connect(jobs_file, timeout=600)
+        with self.conn:
+            # seq keeps the order of the jobs, rev grows with every insert and update so that every reader sees both.
+            self.conn.execute("CREATE TABLE IF NOT EXISTS jobs (seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT UNIQUE, "
+                              "benchmark_name TEXT, tune TEXT, bench_size TEXT, final_score REAL, data TEXT, rev INTEGER)")
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")]
+            if "rev" not in columns:
+                self.conn.execute("ALTER TABLE jobs ADD COLUMN rev INTEGER")
+                self.conn.execute("UPDATE jobs SET rev = seq")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_benchmark ON jobs (benchmark_name, tune, bench_size)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_rev ON jobs (rev)")
+        if is_new and legacy_file is not None and os.path.exists(legacy_file):
+            self.import_jobs(legacy_file)
+
+    def read_new(self):
+        """
+        read the jobs inserted or updated since the last read, an updated job keeps its place.
+        """
+        rows = self.conn.execute("SELECT rev, data FROM jobs WHERE rev > ? ORDER BY seq", (self.last_rev,))
+        for rev, data in rows:
+            self.add_record(json.loads(data))
+            self.last_rev = max(self.last_rev, rev)
+        self.sync_index()
+
+    def load(self):
+        self.read_new()
+        return self.jobs
+
+    def append(self, new_jobs):
+        rows = []
+        for job in new_jobs:
+            rows.append((job.get("job_id"), job["benchmark_name"], job["tune"], job["bench_size"], job["final_score"], json.dumps(job)))
+        with self.conn:
+            self.conn.executemany("INSERT INTO jobs (job_id, benchmark_name, tune, bench_size, final_score, data, rev) "
+                                  "VALUES (?, ?, ?, ?, ?, ?, (SELECT IFNULL(MAX(rev), 0) + 1 FROM jobs))", rows)
+        self.read_new()
+        return self.jobs
+
+    def update(self, job):
+        """
+        replace the row of the job in place, in one transaction, with a new rev so that every reader sees it.
+        """
+        with self.conn:
+            cursor = self.conn.execute("UPDATE jobs SET final_score = ?, data = ?, rev = (SELECT MAX(rev) + 1 FROM jobs) WHERE job_id = ?",
+                                       (job["final_score"], json.dumps(job), job["job_id"]))
+        if cursor.rowcount == 0:
+            return self.append([job])
+        self.read_new()
+        return self.jobs
+
+    def compact(self):
+        self.conn.execute("VACUUM")
+        Logger.info("Compacted %s", self.jobs_file)
+
+class search_checkpoint(object):
+    """
+    the state of the searches, saved after every decision so that a search resumes exactly where it stopped:
+    the seed of its random number generator, the flags of the greedy walk and the candidates being run,
+    with the pid and the log of their runspec. The stochastic searches are replayed from the seed,
+    and the candidates measured before are found in the job store instead of being run again.
+    """
+    def __init__(self, checkpoint_file):
+        """
+        Args:
+            checkpoint_file (str): the JSON file of the states, keyed by "tune benchmark name"
+        """
+        self.checkpoint_file = checkpoint_file
+
+    def load(self, key):
+        """
+        the state saved for the key, or an empty dict.
+        """
+        if not os.path.exists(self.checkpoint_file):
+            return {}
+        with locked_file(self.checkpoint_file):
+            return load_json(self.checkpoint_file).get(key, {})
+
+    def save(self, key, state):
+        """
+        save the state for the key, or remove it if state is None.
+        """
+        with locked_file(self.checkpoint_file):
+            states = load_json(self.checkpoint_file) if os.path.exists(self.checkpoint_file) else {}
+            if state is None:
+                states.pop(key, None)
+            else:
+                states[key] = state
+            dump_json(states, self.checkpoint_file)
+
+def is_running(pid, name):
+    """
+    True if the process pid is alive and its command line contains name, so that a reused pid is not mistaken for it.
+    """
+    try:
+        with open("/proc/%d/cmdline" % (pid), "rb") as fp:
+            cmdline = fp.read()
+            fp.close()
+    except OSError:
+        return False
+    return name.encode() in cmdline
+
+def open_job_store(home_dir, store_type):
+    """
+    open the job store in the home directory.
+    Args:
+        home_dir (str): the directory of the jobs file
+        store_type (str): json, jsonl or sqlite. The jobs in jobs.json are imported into a new jsonl or sqlite store.
+    """
+    legacy_file = os.path.join(home_dir, "jobs.json")
+    if store_type == "json":
+        return json_job_store(legacy_file)
+    elif store_type == "jsonl":
+        return jsonl_job_store(os.path.join(home_dir, "jobs.jsonl"), legacy_file)
+    elif store_type == "sqlite":
+        return sqlite_job_store(os.path.join(home_dir, "jobs.sqlite"), legacy_file)
+    else:
+        Logger.error("Unknown job store %s, it should be json, jsonl or sqlite.", store_type)
+        exit(1)
+
+def job_fitness(job, bench_no):
+    """the fitness of a job to maximize, the final score for ref, or the inverse of the runtime for test and train.
+
+    Args:
+        job (dict): the job
+        bench_no (str): the benchmark number, only used for test and train
+    """
+    if job is None:
+        return 0.0
+    if job["bench_size"] == "ref":
+        return job["final_score"]
+    run_times = [r["RunTime"] for r in job["result"] if r["BenchNO"] == bench_no and r["BenchSize"] == job["bench_size"]]
+    if len(run_times) == 0 or min(run_times) <= 0.0:
+        return 0.0
+    return 1.0/min(run_times)
+
+def build_tree(X, y, samples, rng, max_depth, min_leaf, num_features):
+    """
+    build a regression tree on binary features.
+    Args:
+        X (list): the feature vectors, lists of bools
+        y (list): the targets
+        samples (list): the indices of the samples in this node
+        rng (random.Random): the random number generator
+        max_depth (int): the max depth of the tree
+        min_leaf (int): the min number of samples in a leaf
+        num_features (int): the number of random features tried at each split
+    Returns:
+        a float for a leaf, or a tuple (feature, false branch, true branch)
+    """
+    values = [y[i] for i in samples]
+    mean = sum(values)/len(values)
+    if max_depth == 0 or len(samples) < 2*min_leaf or max(values) == min(values):
+        return mean
+    best = None
+    sse = sum([(v - mean)**2 for v in values])
+    for feature in rng.sample(range(len(X[0])), min(num_features, len(X[0]))):
+        left = [i for i in samples if not X[i][feature]]
+        right = [i for i in samples if X[i][feature]]
+        if len(left) < min_leaf or len(right) < min_leaf:
+            continue
+        split_sse = 0.0
+        for branch in [left, right]:
+            branch_mean = sum([y[i] for i in branch])/len(branch)
+            split_sse += sum([(y[i] - branch_mean)**2 for i in branch])
+        if split_sse < sse and (best is None or split_sse < best[0]):
+            best = (split_sse, feature, left, right)
+    if best is None:
+        return mean
+    split_sse, feature, left, right = best
+    return (feature,
+            build_tree(X, y, left, rng, max_depth-1, min_leaf, num_features),
+            build_tree(X, y, right, rng, max_depth-1, min_leaf, num_features))
+
+def predict_tree(tree, x):
+    """
+    the prediction of a regression tree for the feature vector x.
+    """
+    while isinstance(tree, tuple):
+        feature, left, right = tree
+        tree = right if x[feature] else left
+    return tree
+
+class random_forest(object):
+    """
+    a small random forest regressor in pure python, the spread of the trees is used as the uncertainty.
+    """
+    def __init__(self, num_trees=30, max_depth=8, min_leaf=2):
+        self.num_trees = num_trees
+        self.max_depth = max_depth
+        self.min_leaf = min_leaf
+        self.trees = []
+
+    def fit(self, X, y, rng):
+        """
+        fit the forest with bootstrap samples.
+        """
+        num_features = max(1, int(math.sqrt(len(X[0]))))
+        self.trees = []
+        for i in range(self.num_trees):
+            samples = [rng.randrange(len(X)) for j in range(len(X))]
+            self.trees.append(build_tree(X, y, samples, rng, self.max_depth, self.min_leaf, num_features))
+
+    def predict(self, x):
+        """
+        Returns:
+            (float, float): the mean and the standard deviation of the predictions of the trees.
+        """
+        predictions = [predict_tree(tree, x) for tree in self.trees]
+        mean = sum(predictions)/len(predictions)
+        var = sum([(p - mean)**2 for p in predictions])/len(predictions)
+        return mean, math.sqrt(var)
+
+def job_cost(job):
+    """
+    the wall seconds of runspec for one run of a job, or None if its resource usage was not recorded.
+    """
+    wall = job.get("usage", {}).get("wall")
+    if not wall:
+        return None
+    return wall/max(job.get("repeats", 1), 1)
+
+def expected_improvement(mean, std, best):
+    """
+    the expected improvement over best of a normal distribution.
+    """
+    if std <= 0.0:
+        return max(mean - best, 0.0)
+    z = (mean - best)/std
+    cdf = 0.5*(1.0 + math.erf(z/math.sqrt(2.0)))
+    pdf = math.exp(-0.5*z*z)/math.sqrt(2.0*math.pi)
+    return (mean - best)*cdf + std*pdf
+
+# two-sided 95% quantiles of the t distribution, by the degrees of freedom.
+TQuantiles = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228}
+
+def job_ratios(job):
+    """the ratios measured in all the repetitions of a job.
+    """
+    if "ratios" in job:
+        return job["ratios"]
+    if job["final_score"] > 0.0:
+        return [job["final_score"]]
+    return []
+
+def score_stats(ratios, noise):
+    """the mean, the variance and the half width of the 95% confidence interval of the ratios.
+    With a single ratio, the variance is estimated from the relative noise.
+
+    Args:
+        ratios (list): the ratios
+        noise (float): the relative run-to-run noise, like 0.01
+    """
+    num = len(ratios)
+    if num == 0:
+        return 0.0, 0.0, 0.0
+    mean = sum(ratios)/num
+    if num == 1:
+        var = (noise*mean)**2
+        return mean, var, 1.96*math.sqrt(var)
+    var = sum([(r - mean)**2 for r in ratios])/(num - 1)
+    return mean, var, TQuantiles.get(num - 1, 1.96)*math.sqrt(var/num)
+
+def scores_overlap(job1, job2, noise):
+    """return True if the confidence intervals of the scores of two jobs overlap, so they cannot be told apart.
+    """
+    mean1, var1, half1 = score_stats(job_ratios(job1), noise)
+    mean2, var2, half2 = score_stats(job_ratios(job2), noise)
+    return abs(mean1 - mean2) <= half1 + half2
+
+def response_similarity(responses1, responses2):
+    """the correlation of the log fitness of the flags measured on two benchmarks, 0.0 if fewer than 3 flags are common.
+
+    Args:
+        responses1 (dict): {canonical flags: fitness} of a benchmark
+        responses2 (dict): {canonical flags: fitness} of another benchmark
+    """
+    common = [key for key in responses1 if key in responses2]
+    if len(common) < 3:
+        return 0.0
+    x = [math.log(responses1[key]) for key in common]
+    y = [math.log(responses2[key]) for key in common]
+    mean_x = sum(x)/len(x)
+    mean_y = sum(y)/len(y)
+    cov = sum((a - mean_x)*(b - mean_y) for a, b in zip(x, y))
+    var_x = sum((a - mean_x)**2 for a in x)
+    var_y = sum((b - mean_y)**2 for b in y)
+    if var_x <= 0.0 or var_y <= 0.0:
+        return 0.0
+    return cov/math.sqrt(var_x*var_y)
+
+def get_bench_langs(tune, bench_name):
+    """the languages of a benchmark, or of the int or fp suite for base.
+    """
+    if tune == "base":
+        return {"int": ["C", "C++"], "fp": ["C", "C++", "Fortran"]}.get(bench_name, [])
+    point_type, bench_no, bench_name = get_bench_number_name(tune, bench_name)
+    if bench_no is None:
+        return []
+    return Benchmarks[point_type][bench_no]["lang"]
+
+def get_peak_flags(jobs, tune, bench_name, bench_size, langs):
+    """get the peak flags in the jobs
+
+    Args:
+        jobs (list): a list of jobs. 
+    """
+    idx = find_best_job(jobs, tune, bench_name, bench_size)
+    if idx is None:
+        flags = []
+        for lang in langs:
+            flags.append([])
+        return flags
+    else:
+        return jobs[idx]["gcc_flags"]
+
+def walk_position(flags, options):
+    """ the position of the greedy walk guessed from the flags of its last candidate, when it was not saved:
+    the first language whose last flag is not its last option, at its last flag.
+    A language without flags, or whose last flag is not one of its options, has not been walked yet.
+    Args:
+        flags (list): the flags of each language
+        options (list): the options of each language
+    Returns:
+        (int, int): the language and the index of the option, -1 before the first option
+    """
+    for i, lang_flags in enumerate(flags):
+        if len(options[i]) == 0:
+            continue
+        if len(lang_flags) == 0 or lang_flags[-1] not in options[i]:
+            return (i, -1)
+        if lang_flags[-1] != options[i][-1]:
+            return (i, options[i].index(lang_flags[-1]))
+    return (len(flags) - 1, len(options[-1]) - 1)
+
+def next_walk_position(position, num_options):
+    """ the position after the given one, the greedy walk goes through all the options of each language in turn.
+    Args:
+        position (tuple): the language and the index of the option
+        num_options (list): the number of options of each language
+    Returns:
+        (int, int): the language and the index of the option, or None at the end of the walk
+    """
+    i, j = position
+    if j + 1 < num_options[i]:
+        return (i, j + 1)
+    for k in range(i + 1, len(num_options)):
+        if num_options[k] > 0:
+            return (k, 0)
+    return None
+
+def get_next_option(flags, options):
+    """ get the next option according to current flags.
+    Args:
+        flags (list): the flags of each language
+        options (list): the options, the same for all the languages
+    Returns:
+        (int, str): the language and the next option, or (None, None) at the end of the walk
+    """
+    lang_options = [options for lang_flags in flags]
+    position = next_walk_position(walk_position(flags, lang_options), [len(options) for options in lang_options])
+    if position is None:
+        return (None, None)
+    return (position[0], options[position[1]])
+
+def get_bench_number_name(tune, mystr):
+    """get the benchmark number and name from the given string
+
+    Returns:
+        point_type, benchmark number, benchmark name
+    """
+    if tune == "peak":
+        for point_type, v in Benchmarks.items():
             if mystr in v.keys():
                 return (point_type, mystr, v[mystr]["name"])
         for point_type, v in Benchmarks.items():
@@ -749,7 +2540,6 @@ class param(object):
         """
         # Set some necessary directories.
         self.home_dir = os.getcwd()
-        self.jobs_file = os.path.join(self.home_dir, "jobs.json")
         self.result_dir = os.path.join(self.home_dir, "results")
         self.config_dir = os.path.join(self.home_dir, "config")
         self.program_dir = os.path.abspath(os.path.dirname(__file__))
@@ -759,10 +2549,14 @@ class param(object):
         # Set some common parameters for global minima search and TS calculations
         section = "common"
         self.config_file = config.get(section, "config_file")
+        # the runspec command, like FakeRunSpec.py to try the searches without SPEC CPU 2006.
+        self.runspec = config.get(section, "runspec", fallback="runspec")
         self.tune = config.get(section, "tune").strip().lower()
         self.copies = config.getint(section, "copies", fallback=1)
         self.iterations = config.getint(section, "iterations", fallback=1)
         self.bench_size = config.get(section, "bench_size", fallback="ref")
+        # stop a peak run once it is slower than the best run by this margin, like 0.05 for 5%.
+        self.cutoff_margin = config.getfloat(section, "cutoff_margin", fallback=None)
         benchmark_set = config.get(section, "benchmarks").strip().lower()
         if self.tune == "peak":
             #benchmark set could be int, fp, all, or a list of benchmarks.
@@ -782,11 +2576,162 @@ class param(object):
                 Logger.error("For base benchmark, the benchmark size must be \"ref\". Please modify the config file!")
                 exit(1)
         self.compiler_option_file = config.get(section, "compiler_option_file")
+        # a structured option file, whose requires/conflicts/implies are checked for every candidate.
+        # options.json next to this script by default, an empty value checks only the compiler option file.
+        self.option_rules_file = config.get(section, "option_rules_file", fallback=os.path.join(self.program_dir, "options.json")).strip()
+        if len(self.option_rules_file) == 0:
+            self.option_rules_file = None
+        self.option_model = option_model(self.compiler_option_file, self.option_rules_file)
+        # json, jsonl or sqlite
+        self.job_store_type = config.get(section, "job_store", fallback="json").strip().lower()
+        self.job_store = open_job_store(self.home_dir, self.job_store_type)
+        self.jobs_file = self.job_store.jobs_file
+        # the time spent in each phase of every job, one JSON record per line.
+        self.timing_file = os.path.join(self.home_dir, config.get(section, "timing_file", fallback="timing.jsonl"))
+        # run runspec through RunWithUsage.py, and store the CPU time, peak RSS and compile times with each job.
+        self.resource_usage = config.getboolean(section, "resource_usage", fallback=True)
+        # the state of the searches and the candidates being run, to resume after a crash or a reboot.
+        self.checkpoint = search_checkpoint(os.path.join(self.home_dir, config.get(section, "checkpoint_file", fallback="checkpoint.json")))
+        # the search strategy: greedy, ga, anneal, surrogate, halving or coordinate, with the options of each strategy in its own section.
+        self.search = config.get(section, "search", fallback="greedy").strip().lower()
+        self.seed = config.getint(section, "seed", fallback=None)
+        # the relative run-to-run noise of the scores.
+        self.noise = config.getfloat(section, "noise", fallback=0.01)
+        # repeat a run up to max_repeats times while its score cannot be told apart from the best one.
+        self.max_repeats = config.getint(section, "max_repeats", fallback=1)
+        # shrink the best flags after the search, removing flags as long as the score is within the noise.
+        self.ablation = config.getboolean(section, "ablation", fallback=False)
+        section = "ga"
+        # the first generation splits the options into population groups, the next ones have offspring children each,
+        # parallel_jobs children if offspring is 0.
+        self.ga_population = config.getint(section, "population", fallback=16)
+        self.ga_generations = config.getint(section, "generations", fallback=100)
+        self.ga_offspring = config.getint(section, "offspring", fallback=0)
+        self.ga_tournament = config.getint(section, "tournament", fallback=4)
+        self.ga_crossover = config.getfloat(section, "crossover", fallback=0.2)
+        self.ga_elite = config.getint(section, "elite", fallback=4)
+        section = "anneal"
+        # the options are screened in groups first, and a move adds the next option of the best groups with probability add.
+        self.anneal_groups = config.getint(section, "groups", fallback=10)
+        self.anneal_add = config.getfloat(section, "add", fallback=0.95)
+        # the temperature is relative to the score, 0.005 accepts a 0.5% worse score with probability 1/e.
+        self.anneal_temperature = config.getfloat(section, "temperature", fallback=0.005)
+        self.anneal_min_temperature = config.getfloat(section, "min_temperature", fallback=0.001)
+        self.anneal_cooling = config.getfloat(section, "cooling", fallback=0.95)
+        # geometric, or adaptive which re-heats after reheat_after rejections in a row.
+        self.anneal_schedule = config.get(section, "schedule", fallback="geometric").strip().lower()
+        self.anneal_reheat_after = config.getint(section, "reheat_after", fallback=10)
+        self.anneal_reheat = config.getfloat(section, "reheat", fallback=0.5)
+        self.anneal_steps = config.getint(section, "steps", fallback=200)
+        section = "surrogate"
+        self.surrogate_steps = config.getint(section, "steps", fallback=60)
+        # the initial design screens the options in init groups, the model picks among the next window options of the best groups.
+        self.surrogate_init = config.getint(section, "init", fallback=10)
+        self.surrogate_window = config.getint(section, "window", fallback=2)
+        self.surrogate_batch = config.getint(section, "batch", fallback=0)
+        self.surrogate_candidates = config.getint(section, "candidates", fallback=2000)
+        self.surrogate_trees = config.getint(section, "trees", fallback=30)
+        self.surrogate_max_depth = config.getint(section, "max_depth", fallback=8)
+        # rank the candidates by the expected improvement per predicted second of runspec, from the usage of the jobs.
+        self.surrogate_cost_aware = config.getboolean(section, "cost_aware", fallback=False)
+        section = "halving"
+        self.halving_candidates = config.getint(section, "candidates", fallback=27)
+        self.halving_eta = config.getint(section, "eta", fallback=3)
+        self.halving_fidelities = config.get(section, "fidelities", fallback="test train ref").split()
+        self.halving_rounds = config.getint(section, "rounds", fallback=5)
+        section = "schedule"
+        # the wall time in hours to tune all the benchmarks, the benchmarks with the best expected gain per second go first.
+        self.time_budget = config.getfloat(section, "time_budget", fallback=0.0)*3600.0
+        # the number of recent jobs of a benchmark used to estimate its improvement rate.
+        self.schedule_window = config.getint(section, "window", fallback=10)
+        # the assumed relative gain of one more job, added to the observed gains so that no benchmark starves.
+        self.schedule_prior_gain = config.getfloat(section, "prior_gain", fallback=0.005)
+        section = "transfer"
+        # evaluate the best flags of this many similar benchmarks before the search of a benchmark without jobs.
+        self.transfer_seeds = config.getint(section, "seeds", fallback=0)
+        section = "coordinate"
+        # the max number of rounds over all the languages, the search stops earlier after a round without improvement.
+        self.coordinate_rounds = config.getint(section, "rounds", fallback=3)
+        section = "distributed"
+        # send the candidates to the workers on other machines, see AutoSPECWorker.py.
+        listen = config.get(section, "listen", fallback=None)
+        if listen is not None:
+            self.coordinator = spec_coordinator(listen,
+                                                config.getfloat(section, "lease_timeout", fallback=60.0),
+                                                config.getint(section, "max_attempts", fallback=3),
+                                                config.get(section, "token", fallback=""))
+        else:
+            self.coordinator = None
+        section = "common"
+        # run the next candidate of every peak benchmark in one runspec call.
+        self.batch_benchmarks = config.getboolean(section, "batch_benchmarks", fallback=False)
+        # number of candidates evaluated at the same time, each one pinned to its own cpu set.
+        self.parallel_jobs = config.getint(section, "parallel_jobs", fallback=1)
+        self.cpus_per_job = config.getint(section, "cpus_per_job", fallback=0)
+        if self.coordinator is not None:
+            # the workers run on their own machines.
+            self.cpu_sets = [None]*self.parallel_jobs
+        elif self.parallel_jobs > 1:
+            self.cpu_sets = get_cpu_sets(self.parallel_jobs, self.cpus_per_job)
+            Logger.info("Running %d candidates in parallel on cpu sets %s", self.parallel_jobs, self.cpu_sets)
+        else:
+            self.cpu_sets = [None]
         real_config_file = os.path.join(self.config_dir,self.config_file)
         with open(real_config_file, "r") as fp:
             self.config_lines = fp.readlines()
             fp.close()
-        self.compiler_cfg = get_compiler_options(real_config_file)
+        self.cfg = spec_cfg(self.config_lines)
+        self.ext = self.cfg.get("ext", default="")
+        # a compiler launcher like ccache, so the objects of a language whose flags did not change are not compiled again.
+        self.compiler_launcher = config.get(section, "compiler_launcher", fallback="").strip()
+        if self.compiler_launcher:
+            self.cfg.wrap_compilers(self.compiler_launcher)
+        # reuse the executables of flags which have been built before.
+        self.spec_dir = os.environ.get("SPEC", self.home_dir)
+        build_cache_dir = config.get(section, "build_cache_dir", fallback=None)
+        if build_cache_dir is not None and self.tune == "peak" and self.coordinator is None:
+            build_cache_size = config.getfloat(section, "build_cache_size", fallback=20.0)
+            self.build_cache = build_cache(os.path.join(self.home_dir, build_cache_dir), build_cache_size*1024**3)
+            self.compiler_id = get_compiler_identity(self.config_lines)
+        else:
+            self.build_cache = None
+            self.compiler_id = ""
+
+    def write_cfg(self, overrides, config_file=None, options=None, keep_md5=True):
+        """write a config file with new values for some variables, see spec_cfg.render.
+
+        Args:
+            overrides (dict): {section name: {variable: value}}
+            config_file (str): the name of the config file in the config directory, default is config_file
+            options (dict): new values for the global options
+            keep_md5 (bool): keep the __MD5__ block
+        """
+        if config_file is None:
+            config_file = self.config_file
+        real_config_file = os.path.join(self.config_dir, config_file)
+        with open(real_config_file, "w") as fp:
+            fp.write(self.cfg.render(overrides, options, keep_md5))
+            fp.close()
+
+    def save_timing(self, jobs, timers):
+        """append the time spent in each phase of the jobs to the timing file.
+
+        Args:
+            jobs (list): the new jobs
+            timers (list): the phase_timer of each job
+        """
+        with locked_file(self.timing_file):
+            with open(self.timing_file, "a") as fp:
+                for job, timer in zip(jobs, timers):
+                    record = {"job_id": job["job_id"],
+                              "benchmark_name": job["benchmark_name"],
+                              "tune": job["tune"],
+                              "bench_size": job["bench_size"],
+                              "strategy": job.get("search", {}).get("strategy", "greedy"),
+                              "end_time": job["end_time"],
+                              "spans": {name: round(seconds, 6) for name, seconds in timer.spans.items()}}
+                    fp.write(json.dumps(record) + "\n")
+                fp.close()
 
     def to_dict(self):
         """convert the params to a python dict
@@ -799,6 +2744,14 @@ class param(object):
         my_dict["benchmark"] = self.benchmark_set
         my_dict["config_file"] = self.config_file
         my_dict["compiler_option_file"] = self.compiler_option_file
+        my_dict["option_rules_file"] = self.option_rules_file
+        my_dict["parallel_jobs"] = self.parallel_jobs
+        my_dict["job_store"] = self.job_store_type
+        my_dict["search"] = self.search
+        my_dict["batch_benchmarks"] = self.batch_benchmarks
+        my_dict["distributed"] = self.coordinator is not None
+        my_dict["time_budget"] = self.time_budget
+        my_dict["transfer_seeds"] = self.transfer_seeds
         #my_dict["cfg_struct"] = self.cfg_struct
         return my_dict
 
@@ -809,6 +2762,8 @@ class spec_job():
         """basic informtaion about a spec 2006 benchmark
         """
         self.spec_config = spec_config
+        # the size of the runs, which could differ from the one in SPEC.conf in multi-fidelity searches.
+        self.bench_size = spec_config.bench_size
         self.point_type, self.bench_no, self.bench_name = get_bench_number_name(spec_config.tune, benchmark)
         if spec_config.tune == "base":
             if self.bench_name == "int":
@@ -821,22 +2776,49 @@ class spec_job():
         else:
             self.langs = Benchmarks[self.point_type][self.bench_no]["lang"]
         self.opt_flag_names = [OptMap[lang] for lang in self.langs]
-        self.options = load_json(self.spec_config.compiler_option_file)
-        if os.path.exists(self.spec_config.jobs_file):
-            self.jobs = load_json(self.spec_config.jobs_file)
+        self.option_model = self.spec_config.option_model
+        self.options = self.option_model.names
+        # the options of each language, an option with langs is only tried in those languages.
+        self.lang_options = [self.option_model.options_for(lang) for lang in self.langs]
+        self.job_store = self.spec_config.job_store
+        self.jobs = self.job_store.load()
+        self.index = self.job_store.index
+        if self.spec_config.tune == "base":
+            self.cfg_section = self.spec_config.cfg.base_section(self.bench_name)
         else:
-            self.jobs = []
-        if self.spec_config.tune == "base" and benchmark in ["int", "fp"]:
-            key = "%s_%s" % (benchmark, self.spec_config.tune)
-            self.cfg_struct = self.spec_config.compiler_cfg[key]
-        elif self.spec_config.tune == "peak":
-            self.cfg_struct = self.spec_config.compiler_cfg[self.spec_config.tune][self.bench_no]
+            self.cfg_section = self.spec_config.cfg.peak_section(self.bench_no, self.bench_name)
         self.spec_result = {}
         self.job_status = "Q"
+        self.job_id = ""
+        self.search_info = {"strategy": "greedy"}
+        self.warm_started = False
+        self.propose_timer = phase_timer()
+        self.last_finish = time.perf_counter()
+        self.ratios = []
+        self.repeats = 0
+        # the resource usage of the runs of the job, and the seconds to compile each benchmark.
+        self.usage = {}
+        self.compile_times = {}
         self.log_name = ""
         self.final_score = 0.0
-        if len(self.jobs) > 0:
-            last_job_idx = find_last_job(self.jobs, self.spec_config.tune, self.bench_name, self.spec_config.bench_size)
+        self.checkpoint_key = "%s %s" % (self.spec_config.tune, self.bench_name)
+        self.state = self.spec_config.checkpoint.load(self.checkpoint_key)
+        # the seed is kept in the checkpoint, so that a search without a seed in SPEC.conf resumes with the same one.
+        self.seed = self.spec_config.seed
+        if self.seed is None:
+            self.seed = self.state.get("seed", random.SystemRandom().randrange(2**31))
+        # the state of a stochastic search before its next batch of candidates.
+        self.search_state = None
+        # the candidates being run, keyed by their canonical flags.
+        self.in_flight = {}
+        # the search information of the candidates being evaluated which have their own, keyed by their canonical flags.
+        self.candidate_info = {}
+        # the (language, option index) of the last greedy candidate, guessed from opt_flags if it was not saved.
+        self.walk = tuple(self.state["walk"]) if self.state.get("walk") is not None else None
+        if self.state.get("opt_flags") is not None:
+            self.opt_flags = self.state["opt_flags"]
+        elif len(self.jobs) > 0:
+            last_job_idx = self.index.find_last_job(self.spec_config.tune, self.bench_name, self.bench_size)
             if last_job_idx is not None:
                 self.opt_flags = self.jobs[last_job_idx]["gcc_flags"]
             else:
@@ -851,24 +2833,464 @@ class spec_job():
     def run_spec(self):
         """run spec 2006 using current spec configuration and compiler configuration.
         """
-        out, err = run_spec(self.spec_config, self.bench_name)
-        #out, err = run_fake_spec(self.spec_config, self.bench_name)
-        out_lines = out.split("\n")
-        Logger.debug("Out Lines are\n%s", out_lines)
-        self.log_name = get_log_name(out_lines)
-        self.result = ExtractResFromLog(out_lines)
-        self.final_score = self.get_final_score()
-        Logger.info("The final score for benchmark %s is %f", self.bench_name, self.final_score)
-        self.job_status = "C"
-        self.jobs.append(self.to_dict())
-        dump_json(self.jobs, self.spec_config.jobs_file)
+        if self.find_measured(self.opt_flags) is not None:
+            return
+        self.proposed()
+        parser = asyncio.run(self.run_candidate(self.opt_flags))
+        #parser = run_fake_spec(self.spec_config, self.bench_name, parser=self.new_parser())
+        self.finish([self.opt_flags], [parser])
+
+    def proposed(self):
+        """the candidates to evaluate are proposed, the time since the last jobs were saved is spent in the search.
+        """
+        now = time.perf_counter()
+        self.propose_timer.add("update_cfg", now - self.last_finish)
+        self.last_finish = now
+
+    def finish(self, candidates, parsers):
+        """collect, settle and save the jobs of the candidates, and save the time spent in each phase.
+
+        Args:
+            candidates (list): a list of optimization flags
+            parsers (list): the parsed output of runspec of each candidate
+        """
+        new_jobs = []
+        parsers[0].timer.merge(self.propose_timer)
+        self.propose_timer = phase_timer()
+        for flags, parser in zip(candidates, parsers):
+            entry = self.in_flight.get(json.dumps(canonical_flags(flags)))
+            if entry is not None:
+                self.search_info = entry["search_info"]
+            with parser.timer.span("parse"):
+                job = self.collect_result(parser, flags)
+            with parser.timer.span("repeat"):
+                job = self.settle(job)
+            new_jobs.append(job)
+        start = time.perf_counter()
+        self.save_jobs(new_jobs)
+        persist = time.perf_counter() - start
+        for parser in parsers:
+            parser.timer.add("persist", persist/len(parsers))
+        self.spec_config.save_timing(new_jobs, [parser.timer for parser in parsers])
+        for flags in candidates:
+            self.in_flight.pop(json.dumps(canonical_flags(flags)), None)
+        self.checkpoint()
+        self.last_finish = time.perf_counter()
+
+    def checkpoint(self):
+        """save the state of the search and the candidates being run.
+        """
+        self.spec_config.checkpoint.save(self.checkpoint_key, {"strategy": self.spec_config.search,
+                                                               "seed": self.seed,
+                                                               "opt_flags": self.opt_flags,
+                                                               "walk": self.walk,
+                                                               "pid": os.getpid(),
+                                                               "search": self.search_state,
+                                                               "in_flight": list(self.in_flight.values()),
+                                                               "time": time.time()})
+
+    def complete_search(self):
+        """the search is done, remove its checkpoint so that the next run starts a new search.
+        """
+        self.state = {}
+        self.search_state = None
+        self.spec_config.checkpoint.save(self.checkpoint_key, None)
+
+    def save_search(self, search):
+        """checkpoint the state of a search, with the candidates it is about to evaluate.
+
+        Args:
+            search (dict): the state, with the strategy and the state of its random number generator
+        """
+        self.search_state = search
+        self.checkpoint()
+
+    def load_search(self, strategy, rng=None):
+        """the state of the search saved in the checkpoint by the same strategy with the same seed, or None.
+        The random number generator is restored to its saved state.
+        """
+        search = self.state.get("search")
+        if search is None or search.get("strategy") != strategy or self.state.get("seed") != self.seed:
+            return None
+        if rng is not None:
+            rng_state = search["rng_state"]
+            rng.setstate((rng_state[0], tuple(rng_state[1]), rng_state[2]))
+        return search
+
+    def track(self, flags, parser):
+        """checkpoint a candidate being run, with the pid and the log of its runspec as soon as they are known.
+
+        Args:
+            flags (list): the optimization flags
+            parser (spec_output_parser): the parser of the output of its runspec
+        """
+        key = json.dumps(canonical_flags(flags))
+        entry = {"flags": flags, "bench_size": self.bench_size, "search_info": self.candidate_info.get(key, self.search_info),
+                 "pid": None, "log_name": ""}
+        self.in_flight[key] = entry
+        on_log_name = parser.on_log_name
+        def on_start(proc):
+            entry["pid"] = proc.pid
+            self.checkpoint()
+        def on_new_log_name(log_name):
+            entry["log_name"] = log_name
+            self.checkpoint()
+            on_log_name(log_name)
+        parser.on_start = on_start
+        parser.on_log_name = on_new_log_name
+
+    def resume(self):
+        """collect the candidates which were being run when AutoSPEC stopped, from the logs of their runspec.
+        A runspec which is still running is waited for. A run whose log is missing or incomplete is dropped,
+        the search runs it again.
+        """
+        entries = self.state.get("in_flight", [])
+        self.state["in_flight"] = []
+        if len(entries) == 0:
+            return
+        spec_config = self.spec_config
+        Logger.info("Resuming %d candidates of %s which were being run.", len(entries), self.bench_name)
+        bench_size = self.bench_size
+        search_info = self.search_info
+        opt_flags = self.opt_flags
+        runspec = os.path.basename(spec_config.runspec)
+        for entry in entries:
+            self.in_flight[json.dumps(canonical_flags(entry["flags"]))] = entry
+        for entry in entries:
+            self.bench_size = entry["bench_size"]
+            self.search_info = entry["search_info"]
+            self.in_flight.pop(json.dumps(canonical_flags(entry["flags"])), None)
+            if self.measured_job(entry["flags"]) is not None:
+                continue
+            if entry["pid"] is not None and is_running(entry["pid"], runspec):
+                Logger.info("Waiting for runspec with pid %d of %s to finish.", entry["pid"], self.bench_name)
+                while is_running(entry["pid"], runspec):
+                    time.sleep(CutoffInterval)
+            if not entry["log_name"] or not os.path.exists(entry["log_name"]):
+                Logger.warning("No log of the run of %s with flags %s, it will be run again.", self.bench_name, entry["flags"])
+                continue
+            log = spec_log.from_file(entry["log_name"])
+            results = [r for r in log.result if r["BenchSize"] == self.bench_size]
+            expected = spec_config.iterations*(len(Benchmarks[self.point_type]) if spec_config.tune == "base" else 1)
+            if len(log.build_errors) == 0 and len(results) < expected:
+                Logger.warning("The log %s of %s is incomplete, the run will be run again.", entry["log_name"], self.bench_name)
+                continue
+            Logger.info("Collecting the run of %s with flags %s from %s", self.bench_name, entry["flags"], entry["log_name"])
+            parser = self.new_parser()
+            parser.log_name = entry["log_name"]
+            parser.result = log.result
+            parser.build_errors = log.build_errors
+            parser.compile_times = log.compile_times
+            parser.returncode = 0 if len(log.build_errors) == 0 else 1
+            self.finish([entry["flags"]], [parser])
+        self.bench_size = bench_size
+        self.search_info = search_info
+        self.opt_flags = opt_flags
+        self.checkpoint()
+
+    def find_measured(self, flags):
+        """find the job which already measured the flags, so that runspec is not called again.
+
+        Args:
+            flags (list): the optimization flags
+        Returns:
+            dict: the job, or None if the flags have not been measured.
+        """
+        job = self.measured_job(flags)
+        if job is None:
+            return None
+        Logger.info("The flags %s of %s have been measured in job %s with final score %f, skip it.", flags, self.bench_name, job.get("job_id"), job["final_score"])
+        return job
+
+    def is_new_candidate(self, flags):
+        """True if the flags are valid and have not been measured, so evaluating them costs a run.
+        """
+        flags = self.normalize_flags(flags)
+        return flags is not None and self.measured_job(flags) is None
+
+    def measured_job(self, flags):
+        """the job which measured the flags, or None.
+        """
+        idx = self.index.find_job(self.spec_config.tune, self.bench_size, self.bench_name, flags)
+        if idx is None:
+            return None
+        return self.jobs[idx]
+
+    def evaluate(self, candidates, search_info=None):
+        """evaluate a batch of candidates, parallel_jobs candidates at a time.
+
+        Args:
+            candidates (list): a list of optimization flags
+            search_info (dict): information about the search, stored with each new job,
+                or a list of them, one for each candidate
+        Returns:
+            list: the job of each candidate
+        """
+        # the flags without the redundant ones, equivalent candidates are run once.
+        normalized = [self.normalize_flags(flags) for flags in candidates]
+        valid = [flags for flags in normalized if flags is not None]
+        if isinstance(search_info, list):
+            for flags, info in zip(normalized, search_info):
+                if flags is not None:
+                    self.candidate_info.setdefault(json.dumps(canonical_flags(flags)), info)
+        elif search_info is not None:
+            self.search_info = search_info
+        num = self.spec_config.parallel_jobs
+        for k in range(0, len(valid), num):
+            self.run_spec_parallel(valid[k:k+num])
+        self.candidate_info = {}
+        return [self.measured_job(flags) if flags is not None else None for flags in normalized]
+
+    def fitness(self, job):
+        """the fitness of a job of this benchmark, larger is better.
+        """
+        return job_fitness(job, self.bench_no)
+
+    def save_jobs(self, new_jobs):
+        """append the new jobs to the job store.
+        """
+        self.jobs = self.job_store.append(new_jobs)
+
+    def peak_flags(self):
+        """the flags of the best job, or empty flags if there is no job yet.
+        """
+        idx = self.index.find_best_job(self.spec_config.tune, self.bench_name, self.bench_size)
+        if idx is None:
+            return [[] for lang in self.langs]
+        return self.jobs[idx]["gcc_flags"]
+
+    async def run_candidate(self, flags, config_file=None, ext=None, cpus=None):
+        """write the config file for the flags and run it.
+        With the build cache, the build and the run are split, and the build is skipped if the executables are in the cache.
+
+        Args:
+            flags (list): the optimization flags
+            config_file (str): the name of the config file, default is the one in SPEC.conf
+            ext (str): the extension for the executables, default is unchanged
+            cpus (str): the cpus to run on
+        Returns:
+            spec_output_parser: the parsed output of runspec
+        """
+        spec_config = self.spec_config
+        if spec_config.coordinator is not None:
+            return await self.run_remote(flags, config_file, ext)
+        parser = self.new_parser()
+        self.track(flags, parser)
+        cache = spec_config.build_cache
+        if cache is None:
+            with parser.timer.span("update_cfg"):
+                self.write_cfg(flags, config_file, ext)
+            cmd = runspec_cmd(spec_config, self.bench_name, config_file, cpus, bench_size=self.bench_size)
+            return await stream_cmd(cmd, parser)
+        if ext is None:
+            ext = spec_config.ext
+        cfg_text = spec_config.cfg.build_text(self.bench_no, self.bench_name, self.point_type, spec_config.tune,
+                                              {self.cfg_section: dict(zip(self.opt_flag_names, [" ".join(flag) for flag in flags]))})
+        key = cache.make_key(self.bench_no, dict(zip(self.opt_flag_names, flags)), spec_config.compiler_id, cfg_text)
+        exe_dir = get_exe_dir(spec_config.spec_dir, self.bench_no, self.bench_name)
+        with parser.timer.span("update_cfg"):
+            # the cached executables do not match the MD5 in the new config file.
+            self.write_cfg(flags, config_file, ext, {"check_md5": "0"})
+        with parser.timer.span("cache"):
+            restored = cache.restore(key, exe_dir, ext)
+        if not restored:
+            cmd = runspec_cmd(spec_config, self.bench_name, config_file, cpus, action="build", bench_size=self.bench_size)
+            await stream_cmd(cmd, parser)
+            if len(parser.build_errors) > 0:
+                return parser
+            with parser.timer.span("cache"):
+                cache.store(key, exe_dir, spec_config.tune, ext)
+        # a new parser for the log name of the run.
+        build_parser = parser
+        parser = self.new_parser()
+        self.track(flags, parser)
+        parser.timer.merge(build_parser.timer)
+        add_usage(parser.usage, build_parser.usage)
+        parser.compile_times = build_parser.read_compile_times()
+        cmd = runspec_cmd(spec_config, self.bench_name, config_file, cpus, action="run", bench_size=self.bench_size)
+        return await stream_cmd(cmd, parser)
+
+    async def run_remote(self, flags, config_file=None, ext=None):
+        """send the config file for the flags to a worker and wait for the parsed output of its runspec.
+
+        Args:
+            flags (list): the optimization flags
+            config_file (str): the name of the config file, default is the one in SPEC.conf
+            ext (str): the extension for the executables, default is unchanged
+        Returns:
+            spec_output_parser: the parsed output of runspec on the worker
+        """
+        spec_config = self.spec_config
+        if config_file is None:
+            config_file = spec_config.config_file
+        options = {}
+        if ext is not None:
+            options["ext"] = ext
+        parser = self.new_parser()
+        Logger.info("Generating the new config file.")
+        with parser.timer.span("update_cfg"):
+            config_text = spec_config.cfg.render(self.cfg_values(flags), options, keep_md5=ext is None)
+        task = {"config_file": config_file,
+                "config_text": config_text,
+                "benchmarks": [self.bench_name],
+                "tune": spec_config.tune,
+                "copies": spec_config.copies,
+                "iterations": spec_config.iterations,
+                "bench_size": self.bench_size,
+                "stop_on_build_error": True,
+                "cutoff": None}
+        policy = self.get_cutoff_policy()
+        if policy is not None:
+            task["cutoff"] = {"runtimes": policy.incumbent_runtimes, "margin": policy.margin, "iterations": policy.iterations}
+        return await spec_config.coordinator.run(task, parser)
+
+    def new_parser(self):
+        """a parser for the output of runspec, which stops runspec as soon as a build fails.
+        """
+        parser = spec_output_parser()
+        def on_build_error(bench_no, bench_name):
+            Logger.warning("Failed to build %s.%s, stopping runspec.", bench_no, bench_name)
+            parser.kill()
+        def on_result(res):
+            Logger.info("Got result %s.%s %s %s ratio=%s", res["BenchNO"], res["BenchName"], res["Tune"], res["BenchSize"], res["Ratio"])
+        parser.on_build_error = on_build_error
+        parser.on_result = on_result
+        parser.on_log_name = lambda log_name: Logger.info("The log for this run is in %s", log_name)
+        parser.cutoff = self.get_cutoff_policy()
+        return parser
+
+    def get_cutoff_policy(self):
+        """the cutoff policy according to the runtime of the best job, or None if cutoff is disabled.
+        """
+        spec_config = self.spec_config
+        if spec_config.cutoff_margin is None or spec_config.tune != "peak":
+            return None
+        idx = self.index.find_best_job(spec_config.tune, self.bench_name, self.bench_size)
+        if idx is None:
+            return None
+        runtimes = {}
+        for r in self.jobs[idx]["result"]:
+            if r["BenchNO"] == self.bench_no and r["Tune"] == spec_config.tune and r["BenchSize"] == self.bench_size:
+                runtimes[r["BenchNO"]] = min(r["RunTime"], runtimes.get(r["BenchNO"], r["RunTime"]))
+        return cutoff_policy(runtimes, spec_config.cutoff_margin, spec_config.iterations)
+
+    def collect_result(self, parser, flags):
+        """record the result of the given flags from the parsed output of runspec.
+
+        Args:
+            parser (spec_output_parser): the parsed output of runspec
+            flags (list): the optimization flags used in this run
+        """
+        self.opt_flags = flags
+        self.job_id = uuid.uuid4().hex
+        self.log_name = parser.log_name
+        if not self.log_name:
+            Logger.error("Cannot get the logname from the output")
+        self.result = parser.result
+        if parser.dominated:
+            # the run was cut off, it is known to be slower than the best job.
+            Logger.info("The run of %s with flags %s is dominated by the best job.", self.bench_name, flags)
+            self.result = []
+            self.final_score = 0.0
+            self.job_status = "D"
+        else:
+            self.final_score = self.get_final_score()
+            Logger.info("The final score for benchmark %s with flags %s is %f", self.bench_name, flags, self.final_score)
+            self.job_status = "C"
+        self.ratios = self.get_ratios(self.result)
+        self.repeats = 1
+        self.usage = dict(parser.usage)
+        for name in ["build", "run"]:
+            if name in parser.timer.spans:
+                self.usage[name + "_time"] = round(parser.timer.spans[name], 3)
+        self.compile_times = parser.read_compile_times()
+        return self.to_dict()
+
+    def get_ratios(self, res):
+        """the ratios of this benchmark in a result, for base it is the score of the suite.
+        """
+        tune = self.spec_config.tune
+        if tune == "base" and self.bench_name in ["fp", "int"]:
+            score = GetScore(filter_res(res, tune, self.bench_size, self.bench_name))
+            return [score] if score > 0.0 else []
+        return [r["Ratio"] for r in res if r["Tune"] == tune and r["BenchSize"] == self.bench_size and r["BenchNO"] == self.bench_no]
+
+    def repeat(self, job):
+        """run the flags of a job once more and add the ratios to the job.
+        """
+        Logger.info("Repeating the run of %s with flags %s", self.bench_name, job["gcc_flags"])
+        parser = asyncio.run(self.run_candidate(job["gcc_flags"]))
+        ratios = job_ratios(job) + self.get_ratios(parser.result)
+        mean, var, half = score_stats(ratios, self.spec_config.noise)
+        job["result"] = job["result"] + parser.result
+        job["ratios"] = ratios
+        job["final_score"] = mean
+        job["score_var"] = var
+        job["score_ci"] = half
+        job["repeats"] = job.get("repeats", 1) + 1
+        job["usage"] = add_usage(dict(job.get("usage", {})), parser.usage)
+        return job
+
+    def settle(self, job):
+        """add repetitions to a new job and to the best job while their scores cannot be told apart,
+        so the new job is kept or dropped with confidence.
+        """
+        spec_config = self.spec_config
+        if spec_config.max_repeats <= 1 or job["bench_size"] != "ref" or job["final_score"] <= 0.0:
+            return job
+        incumbent = self.measured_job(self.peak_flags())
+        if incumbent is None or incumbent.get("job_id") == job["job_id"]:
+            return job
+        while scores_overlap(job, incumbent, spec_config.noise):
+            if job["repeats"] <= incumbent.get("repeats", 1) and job["repeats"] < spec_config.max_repeats:
+                self.repeat(job)
+            elif incumbent.get("repeats", 1) < spec_config.max_repeats and "job_id" in incumbent:
+                self.repeat(incumbent)
+                self.jobs = self.job_store.update(incumbent)
+            else:
+                break
+        Logger.info("Settled %s: %f +- %f after %d runs, the best job is %f +- %f after %d runs", self.bench_name,
+                    job["final_score"], job["score_ci"], job["repeats"], incumbent["final_score"],
+                    incumbent.get("score_ci", 0.0), incumbent.get("repeats", 1))
+        return job
+
+    def run_spec_parallel(self, candidates):
+        """evaluate several candidates at the same time.
+        Each candidate gets its own config file and ext, and runs on its own cpu set.
+
+        Args:
+            candidates (list): a list of optimization flags
+        """
+        spec_config = self.spec_config
+        unique = {}
+        for flags in candidates:
+            key = canonical_flags(flags)
+            if key not in unique and self.find_measured(flags) is None:
+                unique[key] = flags
+        candidates = list(unique.values())
+        if len(candidates) == 0:
+            return
+        self.proposed()
+        stem = os.path.splitext(spec_config.config_file)[0]
+        runs = []
+        for k, flags in enumerate(candidates):
+            if spec_config.parallel_jobs == 1:
+                runs.append(self.run_candidate(flags))
+                continue
+            config_file = "%s.p%d.cfg" % (stem, k)
+            ext = "%s_p%d" % (spec_config.ext, k)
+            runs.append(self.run_candidate(flags, config_file, ext, spec_config.cpu_sets[k]))
+        async def run_all():
+            return await asyncio.gather(*runs)
+        parsers = asyncio.run(run_all())
+        self.finish(candidates, parsers)
 
     def get_final_score(self):
         """get the final score from the result, according to the benchmark configuration
         """
         res = self.result
         tune = self.spec_config.tune
-        bench_size = self.spec_config.bench_size
+        bench_size = self.bench_size
         bench_no = self.bench_no
         bench_name = self.bench_name
         if tune == "base" and bench_name in ["fp", "int"]:
@@ -889,59 +3311,1032 @@ class spec_job():
         """convert current info to db dict
         """
         db = {}
+        db["job_id"] = self.job_id
         db["job_status"] = self.job_status
         db["benchmark_number"] = self.bench_no
-        db["bench_size"] = self.spec_config.bench_size
+        db["bench_size"] = self.bench_size
         db["tune"] = self.spec_config.tune
         db["benchmark_name"] = self.bench_name
         db["log_name"] = self.log_name
         db["result"] = self.result
         db["final_score"] = self.final_score
         db["gcc_flags"] = self.opt_flags
+        db["dominated"] = self.job_status == "D"
+        mean, var, half = score_stats(self.ratios, self.spec_config.noise)
+        db["ratios"] = self.ratios
+        db["score_var"] = var
+        db["score_ci"] = half
+        db["repeats"] = self.repeats
+        db["search"] = self.search_info
+        db["usage"] = self.usage
+        db["compile_times"] = self.compile_times
+        db["end_time"] = time.time()
         return db
     
+    def propose_flags(self, cur_flags):
+        """propose the next candidate after cur_flags: the peak flags plus the next option of the walk.
+        The options which are already in the peak flags, conflict with them or add nothing to them are skipped.
+
+        Args:
+            cur_flags (list): the flags of the last candidate
+        Returns:
+            list: the new flags, or None if no more options are available.
+        """
+        Logger.info("Current optimization flags are %s", cur_flags)
+        while True:
+            num_options = [len(options) for options in self.lang_options]
+            if self.walk is None and is_empty_flags(cur_flags):
+                base_flags = copy.deepcopy(cur_flags)
+                if len(self.jobs) > 0:
+                    base_flags = [[] if i == 0 or len(options) == 0 else [options[0]] for i, options in enumerate(self.lang_options)]
+                position = next_walk_position((0, -1), num_options)
+                if position is None:
+                    return None
+                self.walk = position
+                i, j = position
+                new_flags = self.add_option(base_flags, i, self.lang_options[i][j])
+            else:
+                if self.walk is None:
+                    self.walk = walk_position(cur_flags, self.lang_options)
+                position = next_walk_position(self.walk, num_options)
+                if position is None:
+                    return None
+                self.walk = position
+                i, j = position
+                peak_flags = self.peak_flags()
+                if self.lang_options[i][j] in peak_flags[i]:
+                    continue
+                Logger.info("Current peak flags are %s", peak_flags)
+                new_flags = self.add_option(peak_flags, i, self.lang_options[i][j])
+            if new_flags is not None:
+                break
+        Logger.info("New flags are %s", new_flags)
+        return new_flags
+
+    def normalize_flags(self, flags):
+        """remove the duplicate flags and the flags implied by the others from each language,
+        so that equivalent candidates are measured once.
+
+        Args:
+            flags (list): the flags of each language
+        Returns:
+            list: the flags without the redundant ones, or None if some flags conflict or miss a required flag.
+        """
+        new_flags = []
+        for lang_flags in flags:
+            kept, removed = self.option_model.normalize(lang_flags)
+            for flag, kind, other in self.option_model.check(kept):
+                Logger.info("Dropping the flags %s of %s: %s %s %s", flags, self.bench_name, flag, kind, other)
+                return None
+            new_flags.append(kept)
+        return new_flags
+
+    def add_option(self, flags, i, option):
+        """the flags with the option added to language i, without the flags the option makes redundant.
+
+        Returns:
+            list: the new flags, or None if the option conflicts with the flags or adds nothing to them.
+        """
+        new_flags = copy.deepcopy(flags)
+        new_flags[i].append(option)
+        new_flags = self.normalize_flags(new_flags)
+        if new_flags is not None and option not in new_flags[i]:
+            Logger.info("Skipping %s for %s, it adds nothing to %s", option, self.bench_name, flags[i])
+            return None
+        return new_flags
+
+    def next_candidates(self, num):
+        """propose up to num candidates, all of them built on the current peak flags.
+
+        Args:
+            num (int): the number of candidates
+        """
+        candidates = []
+        cur_flags = self.opt_flags
+        for k in range(num):
+            new_flags = self.propose_flags(cur_flags)
+            if new_flags is None:
+                break
+            candidates.append(new_flags)
+            cur_flags = new_flags
+        return candidates
+
+    def write_cfg(self, flags, config_file=None, ext=None, cfg_options=None):
+        """write a cfg file for the given flags.
+
+        Args:
+            flags (list): the optimization flags
+            config_file (str): the name of the config file in the config directory, default is the one in SPEC.conf
+            ext (str): a new extension for the executables, default is unchanged
+            cfg_options (dict): other global options to set in the config file
+        """
+        Logger.info("Generating the new config file.")
+        options = dict(cfg_options) if cfg_options is not None else {}
+        if ext is not None:
+            options["ext"] = ext
+        self.spec_config.write_cfg(self.cfg_values(flags), config_file, options, keep_md5=ext is None)
+
+    def cfg_values(self, flags):
+        """the config section of this benchmark with the given flags, {section name: {variable: value}}.
+        """
+        values = {}
+        for i, flag_type in enumerate(self.opt_flag_names):
+            values[flag_type] = " ".join(flags[i])
+            Logger.info("%s = %s", flag_type, values[flag_type])
+        return {self.cfg_section: values}
+
     def update_cfg(self):
         """ update current configuration and get a new cfg file.
         """
-        if len(self.jobs) == 0:
-            i, next_option = get_next_option(self.opt_flags, self.options)
-            new_flags = copy.deepcopy(self.opt_flags)
-            new_flags[i].append(next_option)
+        new_flags = self.propose_flags(self.opt_flags)
+        if new_flags is None:
+            Logger.info("No more options are available. Ending the optimization of %s", self.bench_name)
+            return False
+        self.opt_flags = new_flags
+        self.write_cfg(new_flags)
+        return True
+
+    def main(self):
+        """
+        main function of the auto spec program
+        """
+        self.resume()
+        if self.spec_config.transfer_seeds > 0:
+            self.warm_start()
+        if self.spec_config.search == "ga":
+            self.main_ga()
+        elif self.spec_config.search == "anneal":
+            self.main_anneal()
+        elif self.spec_config.search == "surrogate":
+            self.main_surrogate()
+        elif self.spec_config.search == "halving":
+            self.main_halving()
+        elif self.spec_config.search == "coordinate":
+            self.main_coordinate()
+        elif self.spec_config.parallel_jobs > 1:
+            self.main_parallel()
+        else:
+            while True:
+                if not self.update_cfg():
+                    break
+                self.run_spec()
+        peak_flags = self.peak_flags()
+        Logger.info("The best options for %s is: %s", self.bench_name, peak_flags)
+        if self.spec_config.ablation:
+            self.ablate()
+        self.complete_search()
+        return True
+
+    def flag_responses(self, bench_name):
+        """the fitness of each set of flags measured on a benchmark, the flags of all the languages together.
+
+        Returns:
+            dict: {canonical flags: fitness}, only the successful jobs
+        """
+        responses = {}
+        for job in self.jobs:
+            if job["benchmark_name"] != bench_name or job["tune"] != self.spec_config.tune or job["bench_size"] != self.bench_size:
+                continue
+            fitness = job_fitness(job, job["benchmark_number"])
+            if fitness > 0.0:
+                key = canonical_flags([sum(job["gcc_flags"], [])])
+                responses[key] = max(fitness, responses.get(key, 0.0))
+        return responses
+
+    def transfer_candidates(self, num):
+        """rank the best flags of the other benchmarks as seeds for this one, by the overlap of their languages
+        and by the similarity of their responses to the flags measured on both.
+        The flags of a language the other benchmark does not have are the flags of its first language.
+
+        Args:
+            num (int): the number of seeds
+        Returns:
+            list: the best (rank, benchmark name, flags)
+        """
+        tune = self.spec_config.tune
+        own = self.flag_responses(self.bench_name)
+        names = set(job["benchmark_name"] for job in self.jobs if job["tune"] == tune and job["bench_size"] == self.bench_size)
+        ranked = []
+        seen = set()
+        for name in sorted(names - set([self.bench_name])):
+            idx = self.index.find_best_job(tune, name, self.bench_size)
+            if idx is None or job_fitness(self.jobs[idx], self.jobs[idx]["benchmark_number"]) <= 0.0:
+                continue
+            langs = get_bench_langs(tune, name)
+            if len(langs) == 0:
+                continue
+            best_flags = self.jobs[idx]["gcc_flags"]
+            flags = [list(best_flags[langs.index(lang)] if lang in langs else best_flags[0]) for lang in self.langs]
+            key = canonical_flags(flags)
+            if key in seen:
+                continue
+            seen.add(key)
+            overlap = len(set(langs) & set(self.langs))/float(len(set(langs) | set(self.langs)))
+            ranked.append((overlap + response_similarity(own, self.flag_responses(name)), name, flags))
+        ranked.sort(key=lambda x: x[0], reverse=True)
+        return ranked[:num]
+
+    def warm_start(self):
+        """evaluate the best flags of the most similar benchmarks, so that the search starts from the best of them.
+        Only a benchmark without jobs of its own is warm started.
+        """
+        self.warm_started = True
+        if self.index.find_last_job(self.spec_config.tune, self.bench_name, self.bench_size) is not None:
+            return
+        seeds = self.transfer_candidates(self.spec_config.transfer_seeds)
+        if len(seeds) == 0:
+            Logger.info("No other benchmark to warm start %s from.", self.bench_name)
+            return
+        candidates = []
+        infos = []
+        for k, (similarity, name, flags) in enumerate(seeds):
+            # the flags of another benchmark may override each other or be implied by others.
+            normalized = self.normalize_flags(flags)
+            if normalized is None:
+                Logger.warning("Skipping the seed of %s from %s, its flags conflict: %s", self.bench_name, name, flags)
+                continue
+            Logger.info("Warm starting %s from the best flags of %s with rank %d (similarity %f): %s",
+                        self.bench_name, name, k + 1, similarity, normalized)
+            candidates.append(normalized)
+            # each job records the benchmark its flags come from.
+            infos.append({"strategy": "transfer", "source": name, "rank": k + 1, "similarity": round(similarity, 4)})
+        if len(candidates) == 0:
+            return
+        search_info = self.search_info
+        self.evaluate(candidates, infos)
+        self.search_info = search_info
+        # the greedy search walks the options from the start again on top of the best seed, skipping the ones in it.
+        self.walk = (0, -1)
+        self.opt_flags = self.peak_flags()
+        Logger.info("The best seed of %s is %s", self.bench_name, self.opt_flags)
+
+    def ablate(self):
+        """
+        backward elimination of the best flags: remove groups of flags, halving the group size down to single flags,
+        and keep a removal if the score stays within the noise of the best score.
+
+        Returns:
+            list: the minimal flags
+        """
+        current = copy.deepcopy(self.peak_flags())
+        best_fitness = self.fitness(self.measured_job(current))
+        if best_fitness <= 0.0:
+            Logger.warning("No successful job of %s to ablate.", self.bench_name)
+            return current
+        target = best_fitness*(1.0 - self.spec_config.noise)
+        items = [(i, flag) for i, flag_list in enumerate(current) for flag in flag_list]
+        Logger.info("Ablating %d flags of %s, keeping the fitness above %f", len(items), self.bench_name, target)
+        chunk = max(1, len(items)//2)
+        while True:
+            k = 0
+            while k < len(items):
+                group = items[k:k+chunk]
+                trial = [[flag for flag in flag_list if (i, flag) not in group] for i, flag_list in enumerate(current)]
+                job = self.evaluate([trial], {"strategy": "ablation", "removed": [flag for i, flag in group]})[0]
+                fitness = self.fitness(job)
+                if fitness >= target:
+                    Logger.info("Removed %s from the flags of %s, the fitness is %f", [flag for i, flag in group], self.bench_name, fitness)
+                    items = items[:k] + items[k+chunk:]
+                    current = trial
+                else:
+                    k += chunk
+            if chunk == 1:
+                break
+            chunk = max(1, chunk//2)
+        Logger.info("The minimal options for %s with the same performance is: %s", self.bench_name, current)
+        return current
+
+    def main_parallel(self):
+        """
+        evaluate parallel_jobs candidates in each round until the options are used up.
+        """
+        while True:
+            candidates = self.next_candidates(self.spec_config.parallel_jobs)
+            if len(candidates) == 0:
+                Logger.info("No more options are available. Ending the optimization of %s", self.bench_name)
+                break
+            self.run_spec_parallel(candidates)
+            self.opt_flags = candidates[-1]
+
+    def encode_flags(self, flags):
+        """encode the flags of each language as a bit vector over the options of the language.
+        """
+        genome = []
+        for flag, options in zip(flags, self.lang_options):
+            genome.extend([option in flag for option in options])
+        return genome
+
+    def decode_flags(self, genome):
+        """decode a bit vector to the flags of each language.
+        """
+        flags = []
+        start = 0
+        for options in self.lang_options:
+            bits = genome[start:start + len(options)]
+            flags.append([option for option, bit in zip(options, bits) if bit])
+            start += len(options)
+        return flags
+
+    def screening_candidates(self, num_groups, rng):
+        """split the options of all the languages into num_groups groups at random, the flags of each group are a candidate.
+        Measuring the groups screens the options: the options of a good group are likely good.
+        """
+        options = [(i, option) for i, lang_options in enumerate(self.lang_options) for option in lang_options]
+        rng.shuffle(options)
+        groups = []
+        for g in range(min(num_groups, len(options))):
+            flags = [[] for lang in self.langs]
+            for i, option in options[g::num_groups]:
+                flags[i].append(option)
+            groups.append(flags)
+        return groups
+
+    def screened_options(self, groups, jobs):
+        """the options of the groups as (language, option), the options of the groups with the best fitness first.
+        """
+        scored = []
+        for flags, job in zip(groups, jobs):
+            scored.extend([(self.fitness(job), i, option) for i, lang_flags in enumerate(flags) for option in lang_flags])
+        scored.sort(key=lambda x: x[0], reverse=True)
+        return [(i, option) for fitness, i, option in scored]
+
+    def flags_fitness(self, flags):
+        """the fitness of the measured job of the flags, 0.0 if they have not been measured or are invalid.
+        """
+        flags = self.normalize_flags(flags)
+        return self.fitness(self.measured_job(flags)) if flags is not None else 0.0
+
+    def main_ga(self):
+        """
+        a genetic algorithm over the flags, with tournament selection, crossover, mutation and elitism.
+        The first generation splits the options into groups, which screens them. Each next generation breeds children
+        from the elite: the crossover is the union of two parents, and the mutation adds the next option of the screening
+        to a parent, so that the options of the best groups are tried first. Each generation is evaluated as a batch.
+        The flags of an individual are kept in order, a later flag overrides an earlier one of its family.
+        """
+        spec_config = self.spec_config
+        rng = random.Random(self.seed)
+        offspring = spec_config.ga_offspring
+        if offspring <= 0:
+            offspring = spec_config.parallel_jobs
+        # the groups are drawn again with the same seed when the search is resumed, they are measured already.
+        groups = self.screening_candidates(spec_config.ga_population, rng)
+        Logger.info("Evaluating generation 0 of %s with %d groups of options", self.bench_name, len(groups))
+        order = self.screened_options(groups, self.evaluate(groups, {"strategy": "ga", "generation": 0}))
+        elite = copy.deepcopy(groups)
+        if not is_empty_flags(self.peak_flags()):
+            elite.append(self.peak_flags())
+        tried = []
+        population = []
+        start = 1
+        search = self.load_search("ga", rng)
+        if search is not None:
+            start = search["generation"]
+            population = search["population"]
+            elite = search["elite"]
+            tried = [tuple(option) for option in search["tried"]]
+            Logger.info("Resuming the genetic algorithm of %s from generation %d", self.bench_name, start)
+        def tournament(scored):
+            contestants = rng.sample(scored, min(spec_config.ga_tournament, len(scored)))
+            return max(contestants, key=lambda x: x[0])[1]
+        def new_child(flags, children):
+            flags = self.normalize_flags(flags)
+            if flags is None or canonical_flags(flags) in children or self.measured_job(flags) is not None:
+                return None
+            return flags
+        def mutate(flags, children):
+            for i, option in order:
+                if (i, option) in tried or option in flags[i]:
+                    continue
+                child = self.add_option(flags, i, option)
+                if child is not None and new_child(child, children) is not None:
+                    tried.append((i, option))
+                    return child
+            return None
+        for generation in range(start, spec_config.ga_generations + 1):
+            scored = sorted([(self.flags_fitness(flags), flags) for flags in elite], key=lambda x: x[0], reverse=True)
+            scored = scored[:spec_config.ga_elite]
+            elite = [flags for fitness, flags in scored]
+            Logger.info("The best fitness before generation %d of %s is %f with flags %s",
+                        generation, self.bench_name, scored[0][0], scored[0][1])
+            children = {}
+            while len(population) == 0 and len(children) < offspring:
+                parent1 = tournament(scored)
+                child = None
+                others = [x for x in scored if x[1] != parent1]
+                if len(others) > 0 and rng.random() < spec_config.ga_crossover:
+                    parent2 = tournament(others)
+                    child = new_child([flags1 + [flag for flag in flags2 if flag not in flags1]
+                                       for flags1, flags2 in zip(parent1, parent2)], children)
+                # a crossover which adds nothing new is a mutation. The options already tried by a mutation are skipped,
+                # once all of them have been tried they are tried again on the new elite.
+                if child is None:
+                    child = mutate(parent1, children)
+                    if child is None and len(tried) > 0:
+                        del tried[:]
+                        child = mutate(parent1, children)
+                    if child is None:
+                        break
+                children[canonical_flags(child)] = child
+            if len(population) == 0:
+                population = list(children.values())
+            if len(population) == 0:
+                Logger.info("No more options are available. Ending the genetic algorithm of %s", self.bench_name)
+                break
+            self.save_search({"strategy": "ga", "generation": generation, "population": population, "elite": elite,
+                              "tried": tried, "rng_state": rng.getstate()})
+            Logger.info("Evaluating generation %d of %s with %d individuals", generation, self.bench_name, len(population))
+            self.evaluate(population, {"strategy": "ga", "generation": generation})
+            elite = elite + population
+            population = []
+
+    def last_search_job(self, strategy):
+        """the last job of this benchmark written by the given search strategy, or None
+        if no search of the strategy is in progress in the checkpoint, so a finished search is not resumed.
+        """
+        if self.state.get("strategy") != strategy:
+            return None
+        for job in reversed(self.jobs):
+            if job["benchmark_name"] == self.bench_name and job["tune"] == self.spec_config.tune and \
+               job["bench_size"] == self.bench_size and job.get("search", {}).get("strategy") == strategy:
+                return job
+        return None
+
+    def anneal_move(self, flags, rng):
+        """a random move from the flags: add an option, remove a flag, or swap a flag for an option.
+
+        Returns:
+            (str, list): the move and the new flags
+        """
+        new_flags = copy.deepcopy(flags)
+        i = rng.choice([i for i in range(len(self.langs)) if len(self.lang_options[i]) > 0 or len(new_flags[i]) > 0])
+        absent = [option for option in self.lang_options[i] if option not in new_flags[i]]
+        moves = []
+        if len(absent) > 0:
+            moves.append("add")
+        if len(new_flags[i]) > 0:
+            moves.append("remove")
+        if len(absent) > 0 and len(new_flags[i]) > 0:
+            moves.append("swap")
+        move = rng.choice(moves)
+        if move == "add":
+            new_flags[i].append(rng.choice(absent))
+        elif move == "remove":
+            del new_flags[i][rng.randrange(len(new_flags[i]))]
         else:
-            Logger.info("Current optimization flags are %s", self.opt_flags)
-            if is_empty_flags(self.opt_flags):
-                new_flags = [[self.options[0]] for flag in self.opt_flags]
+            new_flags[i][rng.randrange(len(new_flags[i]))] = rng.choice(absent)
+        return move, new_flags
+
+    def main_anneal(self):
+        """
+        simulated annealing over the flags, using KeepFlags as the acceptance test.
+        The options are screened in groups first, like the first generation of the genetic algorithm, and the annealing
+        starts from the best group or from the best flags found so far. A move adds the next option of the best groups
+        with probability add, otherwise it is a random add, remove or swap.
+        The state of the search, including the state of the random number generator, is saved with each job,
+        so the search is reproducible with the same seed and is resumed from the last job.
+        """
+        spec_config = self.spec_config
+        rng = random.Random(self.seed)
+        # the groups are drawn again with the same seed when the search is resumed, they are measured already.
+        groups = self.screening_candidates(spec_config.anneal_groups, rng)
+        Logger.info("Screening the options of %s in %d groups", self.bench_name, len(groups))
+        order = self.screened_options(groups, self.evaluate(groups, [{"strategy": "anneal", "group": g} for g in range(len(groups))]))
+        current = self.peak_flags()
+        current_fitness = self.fitness(self.measured_job(current))
+        temperature = spec_config.anneal_temperature
+        rejections = 0
+        step = 0
+        added = 0
+        pending = None
+        last_job = self.last_search_job("anneal")
+        if last_job is not None and "step" in last_job["search"]:
+            # redo the acceptance test of the last job with the saved state.
+            info = last_job["search"]
+            rng_state = info["rng_state"]
+            rng.setstate((rng_state[0], tuple(rng_state[1]), rng_state[2]))
+            current = info["current"]
+            current_fitness = info["current_fitness"]
+            temperature = info["temperature"]
+            rejections = info["rejections"]
+            step = info["step"]
+            added = info["added"]
+            pending = (last_job["gcc_flags"], self.fitness(last_job))
+            Logger.info("Resuming the annealing of %s from step %d", self.bench_name, step)
+        while step < spec_config.anneal_steps:
+            if pending is None:
+                # a move to flags measured before costs no run, a few moves are drawn to find new flags.
+                for k in range(NewCandidateTries):
+                    while added < len(order) and order[added][1] in current[order[added][0]]:
+                        added += 1
+                    if added < len(order) and rng.random() < spec_config.anneal_add:
+                        i, option = order[added]
+                        added += 1
+                        move = "add"
+                        candidate = copy.deepcopy(current)
+                        candidate[i].append(option)
+                    else:
+                        move, candidate = self.anneal_move(current, rng)
+                    if self.is_new_candidate(candidate):
+                        break
+                info = {"strategy": "anneal", "step": step, "move": move, "temperature": temperature,
+                        "rejections": rejections, "current": current, "current_fitness": current_fitness,
+                        "added": added, "rng_state": rng.getstate()}
+                job = self.evaluate([candidate], info)[0]
+                pending = (candidate, self.fitness(job))
+            candidate, fitness = pending
+            pending = None
+            if current_fitness <= 0.0 or KeepFlags(current_fitness, fitness, temperature*current_fitness, rng):
+                Logger.info("Step %d of %s: accepted %s with fitness %f (was %f) at temperature %f",
+                            step, self.bench_name, candidate, fitness, current_fitness, temperature)
+                current = candidate
+                current_fitness = fitness
+                rejections = 0
             else:
-                i, next_option = get_next_option(self.opt_flags, self.options)
-                if i is None:
-                    Logger.info("No more options are available. Ending the optimization of %s", self.bench_name)
+                rejections += 1
+            temperature = max(temperature*spec_config.anneal_cooling, spec_config.anneal_min_temperature)
+            if spec_config.anneal_schedule == "adaptive" and rejections >= spec_config.anneal_reheat_after:
+                temperature = max(temperature, spec_config.anneal_temperature*spec_config.anneal_reheat)
+                Logger.info("Re-heating the annealing of %s to temperature %f", self.bench_name, temperature)
+                rejections = 0
+            step += 1
+
+    def benchmark_jobs(self):
+        """all the jobs of this benchmark with the current tune and size.
+        """
+        return [job for job in self.jobs if job["benchmark_name"] == self.bench_name and
+                job["tune"] == self.spec_config.tune and job["bench_size"] == self.bench_size]
+
+    def main_surrogate(self):
+        """
+        a surrogate-guided search: a random forest trained on the jobs of this benchmark scores the candidates,
+        and only the ones with the highest expected improvement are evaluated with runspec.
+        The initial design screens the options in init groups. The candidates are the best flags plus one of the next
+        window options of the best groups, then the neighbours of the best jobs once all the options have been tried.
+        """
+        spec_config = self.spec_config
+        rng = random.Random(self.seed)
+        batch = spec_config.surrogate_batch
+        if batch <= 0:
+            batch = spec_config.parallel_jobs
+        # the groups are drawn again with the same seed when the search is resumed, they are measured already.
+        groups = self.screening_candidates(spec_config.surrogate_init, rng)
+        Logger.info("Screening the options of %s in %d groups", self.bench_name, len(groups))
+        order = self.screened_options(groups, self.evaluate(groups, {"strategy": "surrogate", "evaluations": 0}))
+        evaluated = len(groups)
+        tried = []
+        search = self.load_search("surrogate", rng)
+        if search is not None:
+            # the candidates picked before the stop are evaluated first.
+            evaluated = search["evaluated"]
+            tried = [tuple(option) for option in search["tried"]]
+            Logger.info("Resuming the surrogate search of %s after %d evaluations", self.bench_name, evaluated)
+            self.evaluate(search["candidates"], {"strategy": "surrogate", "evaluations": evaluated})
+            evaluated += len(search["candidates"])
+        while evaluated < spec_config.surrogate_steps:
+            jobs = [job for job in self.benchmark_jobs() if not job.get("dominated")]
+            pool = {}
+            def add_to_pool(flags, option=None):
+                flags = self.normalize_flags(flags)
+                if flags is None:
                     return False
+                key = canonical_flags(flags)
+                if key in pool or self.measured_job(flags) is not None:
+                    return False
+                pool[key] = (flags, option)
+                return True
+            best_flags = self.peak_flags()
+            for k in range(2):
+                for i, option in order:
+                    if len(pool) >= spec_config.surrogate_window:
+                        break
+                    if (i, option) not in tried and option not in best_flags[i]:
+                        flags = self.add_option(best_flags, i, option)
+                        if flags is not None:
+                            add_to_pool(flags, (i, option))
+                # all the options have been tried, they are tried again on the new best flags.
+                if len(pool) > 0 or len(tried) == 0:
+                    break
+                del tried[:]
+            if len(pool) == 0:
+                top_jobs = sorted(jobs, key=lambda job: self.fitness(job), reverse=True)[:5]
+                for i in range(spec_config.surrogate_candidates):
+                    move, flags = self.anneal_move(rng.choice(top_jobs)["gcc_flags"], rng)
+                    add_to_pool(flags)
+            X = [self.encode_flags(job["gcc_flags"]) for job in jobs]
+            y = [self.fitness(job) for job in jobs]
+            model = random_forest(spec_config.surrogate_trees, spec_config.surrogate_max_depth)
+            model.fit(X, y, rng)
+            best_fitness = max(y)
+            cost_model = None
+            timed = [job for job in jobs if job_cost(job) is not None]
+            if spec_config.surrogate_cost_aware and len(timed) >= spec_config.surrogate_init:
+                cost_model = random_forest(spec_config.surrogate_trees, spec_config.surrogate_max_depth)
+                cost_model.fit([self.encode_flags(job["gcc_flags"]) for job in timed], [job_cost(job) for job in timed], rng)
+            scored = []
+            for flags, option in pool.values():
+                mean, std = model.predict(self.encode_flags(flags))
+                ei = expected_improvement(mean, std, best_fitness)
+                if cost_model is not None:
+                    ei /= max(cost_model.predict(self.encode_flags(flags))[0], 1.0)
+                scored.append((ei, mean, flags, option))
+            # the options of the best groups first among the candidates with the same expected improvement.
+            scored.sort(key=lambda x: x[0], reverse=True)
+            candidates = [flags for ei, mean, flags, option in scored[:batch]]
+            tried.extend([option for ei, mean, flags, option in scored[:batch] if option is not None])
+            if len(candidates) == 0:
+                Logger.info("No more candidates for %s", self.bench_name)
+                break
+            Logger.info("The surrogate of %s picked %d of %d candidates, the best expected improvement is %f (predicted fitness %f)",
+                        self.bench_name, len(candidates), len(scored), scored[0][0], scored[0][1])
+            self.save_search({"strategy": "surrogate", "evaluated": evaluated, "candidates": candidates, "tried": tried,
+                              "rng_state": rng.getstate()})
+            self.evaluate(candidates, {"strategy": "surrogate", "evaluations": evaluated})
+            evaluated += len(candidates)
+
+    def halving_candidates(self, peak_flags, rng):
+        """the candidates of a round of successive halving, which have not been measured at the first size.
+
+        Args:
+            peak_flags (list): the peak flags at the last size
+            rng (random.Random): the random number generator of the search
+        """
+        spec_config = self.spec_config
+        candidates = {}
+        def add_candidate(flags):
+            flags = self.normalize_flags(flags)
+            if flags is None:
+                return
+            key = canonical_flags(flags)
+            if key not in candidates and self.measured_job(flags) is None:
+                candidates[key] = flags
+        for i in range(len(self.langs)):
+            for option in self.lang_options[i]:
+                if len(candidates) >= spec_config.halving_candidates:
+                    break
+                if option not in peak_flags[i]:
+                    flags = copy.deepcopy(peak_flags)
+                    flags[i].append(option)
+                    add_candidate(flags)
+        for attempt in range(10*spec_config.halving_candidates):
+            if len(candidates) >= spec_config.halving_candidates:
+                break
+            move, flags = self.anneal_move(peak_flags, rng)
+            add_candidate(flags)
+        return list(candidates.values())
+
+    def main_halving(self):
+        """
+        successive halving over the fidelities: many candidates are screened at the first size (like test),
+        the best 1/eta of them are promoted to the next size, and only the finalists run at the last size (like ref).
+        The candidates of each round are the peak flags at the last size plus one option, or a random move from them.
+        """
+        spec_config = self.spec_config
+        rng = random.Random(self.seed)
+        fidelities = spec_config.halving_fidelities
+        start = 0
+        search = self.load_search("halving", rng)
+        if search is not None:
+            start = search["round"]
+            Logger.info("Resuming the successive halving of %s from round %d", self.bench_name, start)
+        for round_no in range(start, spec_config.halving_rounds):
+            self.bench_size = fidelities[-1]
+            peak_flags = self.peak_flags()
+            best_fitness = self.fitness(self.measured_job(peak_flags))
+            self.bench_size = fidelities[0]
+            if search is not None:
+                # the candidates of the round being run before the stop.
+                survivors = search["candidates"]
+                search = None
+            else:
+                survivors = self.halving_candidates(peak_flags, rng)
+                self.save_search({"strategy": "halving", "round": round_no, "candidates": survivors, "rng_state": rng.getstate()})
+            if len(survivors) == 0:
+                Logger.info("No more candidates for %s", self.bench_name)
+                break
+            for rung, bench_size in enumerate(fidelities):
+                self.bench_size = bench_size
+                Logger.info("Round %d of %s: evaluating %d candidates at size %s", round_no, self.bench_name, len(survivors), bench_size)
+                jobs = self.evaluate(survivors, {"strategy": "halving", "round": round_no, "rung": rung})
+                if rung == len(fidelities) - 1:
+                    break
+                ranked = sorted(zip([self.fitness(job) for job in jobs], range(len(survivors))), reverse=True)
+                num = max(1, int(math.ceil(len(survivors)/float(spec_config.halving_eta))))
+                survivors = [survivors[k] for fitness, k in ranked[:num] if fitness > 0.0]
+                if len(survivors) == 0:
+                    break
+            self.bench_size = fidelities[-1]
+            new_fitness = self.fitness(self.measured_job(self.peak_flags()))
+            Logger.info("Round %d of %s: the best fitness at size %s is %f (was %f)", round_no, self.bench_name, fidelities[-1], new_fitness, best_fitness)
+        self.bench_size = fidelities[-1]
+
+    def main_coordinate(self):
+        """
+        coordinate descent over the languages: the flags of one language are tuned at a time, with the flags of the
+        other languages held at the peak flags, so that COPTIMIZE, CXXOPTIMIZE and FOPTIMIZE are tuned independently.
+        Within a language, the options are added to the peak flags one by one like the greedy search, parallel_jobs
+        at a time. The rounds go on until a round improves no language.
+        With compiler_launcher = ccache, only the objects of the language being tuned are compiled again.
+        """
+        spec_config = self.spec_config
+        start = 0
+        search = self.load_search("coordinate")
+        if search is not None:
+            start = search["round"]
+            Logger.info("Resuming the coordinate descent of %s from round %d, language %s", self.bench_name, start, self.langs[search["lang"]])
+        for round_no in range(start, spec_config.coordinate_rounds):
+            improved = []
+            for i, lang in enumerate(self.langs):
+                k = 0
+                # the candidates picked before the stop are evaluated first.
+                candidates = []
+                if search is not None:
+                    if i < search["lang"]:
+                        continue
+                    improved = search["improved"]
+                    start_fitness = search["start_fitness"]
+                    k = search["k"]
+                    candidates = search["candidates"]
+                    search = None
                 else:
-                    peak_flags = get_peak_flags(self.jobs, self.spec_config.tune, self.bench_name, self.spec_config.bench_size, self.langs)
-                    Logger.info("Current peak flags are %s", peak_flags)
-                    new_flags = copy.deepcopy(peak_flags)
-                    new_flags[i].append(next_option)
-        Logger.info("New flags are %s", new_flags)
-        self.opt_flags = new_flags
-        new_cfg_lines = update_cfg_lines(self.spec_config.config_lines,
-                                        self.opt_flag_names,
-                                        self.cfg_struct, new_flags)
-        real_config_file = os.path.join(self.spec_config.config_dir, self.spec_config.config_file )
-        with open(real_config_file, "w") as fp:
-            fp.writelines(new_cfg_lines)
-            fp.close()
-            return True
+                    start_fitness = self.fitness(self.measured_job(self.peak_flags()))
+                options = self.lang_options[i]
+                Logger.info("Round %d of %s: tuning the %s flags with %d options", round_no, self.bench_name, lang, len(options))
+                while k < len(options) or len(candidates) > 0:
+                    if len(candidates) == 0:
+                        peak_flags = self.peak_flags()
+                        while k < len(options) and len(candidates) < spec_config.parallel_jobs:
+                            option = options[k]
+                            k += 1
+                            if option in peak_flags[i]:
+                                continue
+                            flags = self.add_option(peak_flags, i, option)
+                            if flags is not None:
+                                candidates.append(flags)
+                        self.save_search({"strategy": "coordinate", "round": round_no, "lang": i, "k": k, "candidates": candidates,
+                                          "start_fitness": start_fitness, "improved": improved})
+                    if len(candidates) > 0:
+                        self.evaluate(candidates, {"strategy": "coordinate", "round": round_no, "lang": lang})
+                        candidates = []
+                if self.fitness(self.measured_job(self.peak_flags())) > start_fitness:
+                    improved.append(lang)
+            Logger.info("Round %d of %s improved the flags of %s", round_no, self.bench_name, improved)
+            if len(improved) == 0:
+                break
+
+class spec_batch():
+    """tune several peak benchmarks together.
+    In each round, the next candidate of every benchmark still being tuned goes into its own peak section
+    of one config file, and all of them are built and run by a single runspec call.
+    """
+    def __init__(self, spec_config:param, benchmarks:list):
+        self.spec_config = spec_config
+        self.job_store = spec_config.job_store
+        self.spec_jobs = [spec_job(spec_config, benchmark) for benchmark in benchmarks]
+        self.active = list(self.spec_jobs)
+        self.propose_timer = phase_timer()
+
+    def sync(self):
+        """share the jobs saved by one benchmark with the others, the index of the store is already shared.
+        """
+        for job in self.spec_jobs:
+            job.jobs = self.job_store.jobs
+
+    def next_round(self):
+        """propose the next unmeasured candidate of each benchmark still being tuned.
+
+        Returns:
+            list: a list of (spec_job, flags)
+        """
+        candidates = []
+        for job in list(self.active):
+            while True:
+                new_flags = job.propose_flags(job.opt_flags)
+                if new_flags is None:
+                    Logger.info("No more options are available. Ending the optimization of %s", job.bench_name)
+                    self.active.remove(job)
+                    break
+                job.opt_flags = new_flags
+                if job.find_measured(new_flags) is None:
+                    candidates.append((job, new_flags))
+                    break
+        return candidates
+
+    def new_parser(self):
+        """a parser for the output of runspec. A failed build only fails its own benchmark,
+        and runs are not cut off since runspec runs the other benchmarks too.
+        """
+        parser = spec_output_parser()
+        def on_build_error(bench_no, bench_name):
+            Logger.warning("Failed to build %s.%s.", bench_no, bench_name)
+        def on_result(res):
+            Logger.info("Got result %s.%s %s %s ratio=%s", res["BenchNO"], res["BenchName"], res["Tune"], res["BenchSize"], res["Ratio"])
+        parser.on_build_error = on_build_error
+        parser.on_result = on_result
+        parser.on_log_name = lambda log_name: Logger.info("The log for this run is in %s", log_name)
+        return parser
+
+    def run_round(self, candidates):
+        """run the candidates in one runspec call and save a job for each of them.
+
+        Args:
+            candidates (list): a list of (spec_job, flags)
+        """
+        spec_config = self.spec_config
+        Logger.info("Generating the config file for %d benchmarks.", len(candidates))
+        parser = self.new_parser()
+        timer = parser.timer
+        timer.merge(self.propose_timer)
+        self.propose_timer = phase_timer()
+        with timer.span("update_cfg"):
+            overrides = {}
+            for job, flags in candidates:
+                overrides.update(job.cfg_values(flags))
+        benchmarks = [job.bench_name for job, flags in candidates]
+        if spec_config.coordinator is not None:
+            with timer.span("update_cfg"):
+                config_text = spec_config.cfg.render(overrides)
+            task = {"config_file": spec_config.config_file,
+                    "config_text": config_text,
+                    "benchmarks": benchmarks,
+                    "tune": spec_config.tune,
+                    "copies": spec_config.copies,
+                    "iterations": spec_config.iterations,
+                    "bench_size": spec_config.bench_size,
+                    "stop_on_build_error": False,
+                    "cutoff": None}
+            parser = asyncio.run(spec_config.coordinator.run(task, parser))
+        else:
+            with timer.span("update_cfg"):
+                spec_config.write_cfg(overrides)
+            cmd = runspec_cmd(spec_config, benchmarks)
+            parser = asyncio.run(stream_cmd(cmd, parser))
+        # the benchmarks share the time of the runspec call.
+        timer = parser.timer.share(len(candidates))
+        for job, flags in candidates:
+            self.sync()
+            bench_parser = parser.split(job.bench_no)
+            bench_parser.timer.merge(timer)
+            job.finish([flags], [bench_parser])
 
     def main(self):
         """
-        main function of the auto spec program
+        tune the benchmarks round by round until the options of all of them are used up.
         """
+        if self.spec_config.build_cache is not None:
+            Logger.warning("The build cache is not used when the benchmarks are batched.")
+        for job in self.spec_jobs:
+            job.resume()
         while True:
-            if not self.update_cfg():
+            self.sync()
+            with self.propose_timer.span("update_cfg"):
+                candidates = self.next_round()
+            if len(candidates) == 0:
                 break
-            self.run_spec()
-        peak_flags = get_peak_flags(self.jobs, self.spec_config.tune, self.bench_name, self.spec_config.bench_size, self.langs)
-        Logger.info("The best options for %s is: %s", self.bench_name, peak_flags)
+            self.run_round(candidates)
+        self.sync()
+        for job in self.spec_jobs:
+            Logger.info("The best options for %s is: %s", job.bench_name, job.peak_flags())
+            if self.spec_config.ablation:
+                job.ablate()
+            job.complete_search()
+        return True
+
+class spec_scheduler():
+    """tune several benchmarks within a wall time budget.
+    The greedy steps of the benchmarks are interleaved: the next step goes to the benchmark with the largest
+    expected gain of the suite geometric mean per second, estimated from its recent jobs and from the timing file.
+    """
+    def __init__(self, spec_config:param, benchmarks:list):
+        self.spec_config = spec_config
+        self.job_store = spec_config.job_store
+        self.spec_jobs = [spec_job(spec_config, benchmark) for benchmark in benchmarks]
+        self.active = list(self.spec_jobs)
+        # the wall time of the steps of each benchmark.
+        self.step_times = {job.bench_name: [] for job in self.spec_jobs}
+        self.load_timing()
+
+    def load_timing(self):
+        """the time of the jobs of former runs, from the timing file.
+        """
+        timing_file = self.spec_config.timing_file
+        if not os.path.exists(timing_file):
+            return
+        with open(timing_file, "r") as fp:
+            for line in fp:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record["benchmark_name"] in self.step_times and record["tune"] == self.spec_config.tune:
+                    self.step_times[record["benchmark_name"]].append(sum(record["spans"].values()))
+            fp.close()
+
+    def sync(self):
+        """share the jobs saved by one benchmark with the others.
+        """
+        for job in self.spec_jobs:
+            job.jobs = self.job_store.jobs
+
+    def step_time(self, job):
+        """the expected wall time of the next step of a benchmark: the mean of its last steps,
+        the wall time of runspec in the usage of its jobs when no step was timed,
+        or the mean of all the benchmarks for a benchmark which has not run yet.
+        """
+        window = self.spec_config.schedule_window
+        times = self.step_times[job.bench_name][-window:]
+        if len(times) == 0:
+            # the candidates of a step run at the same time.
+            times = [cost for cost in map(job_cost, job.benchmark_jobs()) if cost is not None][-window:]
+        if len(times) == 0:
+            times = [t for v in self.step_times.values() for t in v[-window:]]
+        if len(times) == 0:
+            return 1.0
+        return sum(times)/len(times)
+
+    def gain_rate(self, job):
+        """the expected log gain of the score of a benchmark in its next job,
+        the mean of the gains of its best score in the last jobs and the prior gain.
+        """
+        spec_config = self.spec_config
+        best = None
+        gains = []
+        for other in job.jobs:
+            if other["benchmark_name"] != job.bench_name or other["tune"] != spec_config.tune or other["bench_size"] != job.bench_size:
+                continue
+            fitness = job.fitness(other)
+            if best is not None:
+                # a failed job gains nothing.
+                gains.append(math.log(fitness/best) if fitness > best > 0.0 else 0.0)
+                best = max(best, fitness)
+            else:
+                best = fitness
+        gains = gains[-spec_config.schedule_window:]
+        return (sum(gains) + spec_config.schedule_prior_gain)/(len(gains) + 1)
+
+    def step(self, job):
+        """run the next greedy candidates of a benchmark.
+
+        Returns:
+            bool: False if no more options are available
+        """
+        # the time of the steps of the other benchmarks is not spent on this one.
+        job.last_finish = time.perf_counter()
+        if self.spec_config.transfer_seeds > 0 and not job.warm_started:
+            job.warm_start()
+        candidates = job.next_candidates(self.spec_config.parallel_jobs)
+        if len(candidates) == 0:
+            Logger.info("No more options are available. Ending the optimization of %s", job.bench_name)
+            return False
+        job.run_spec_parallel(candidates)
+        job.opt_flags = candidates[-1]
+        return True
+
+    def main(self):
+        """
+        run the step with the best expected gain per second, until the budget is used up or the options of all the benchmarks are.
+        A benchmark which has not run yet goes first, and a step which would not end within the budget is not started.
+        """
+        checkpoint = self.spec_config.checkpoint
+        # the time used before a crash or a reboot counts against the budget.
+        used = checkpoint.load("schedule").get("used", 0.0)
+        budget = self.spec_config.time_budget - used
+        start = time.perf_counter()
+        Logger.info("Tuning %d benchmarks in %.1f hours", len(self.spec_jobs), budget/3600.0)
+        for job in self.spec_jobs:
+            job.resume()
+        while len(self.active) > 0:
+            self.sync()
+            checkpoint.save("schedule", {"used": used + time.perf_counter() - start})
+            remaining = budget - (time.perf_counter() - start)
+            scored = []
+            for job in self.active:
+                seconds = self.step_time(job)
+                if seconds > remaining:
+                    continue
+                new = len(self.step_times[job.bench_name]) == 0
+                scored.append((new, self.gain_rate(job)/seconds, seconds, job))
+            if len(scored) == 0:
+                Logger.info("The time budget is used up with %.0f seconds left.", remaining)
+                break
+            new, rate, seconds, job = max(scored, key=lambda x: (x[0], x[1]))
+            Logger.info("Scheduling %s, the expected log gain is %g per second over %.1f seconds", job.bench_name, rate, seconds)
+            step_start = time.perf_counter()
+            num_jobs = len(self.job_store.jobs)
+            if not self.step(job):
+                self.active.remove(job)
+                continue
+            if len(self.job_store.jobs) > num_jobs:
+                # the candidates which had been measured before take no time.
+                self.step_times[job.bench_name].append(time.perf_counter() - step_start)
+        checkpoint.save("schedule", None)
+        self.sync()
+        for job in self.spec_jobs:
+            Logger.info("The best options for %s is: %s", job.bench_name, job.peak_flags())
+            if job not in self.active:
+                job.complete_search()
+        if self.spec_config.ablation:
+            Logger.warning("The ablation is not run within a time budget.")
         return True
 
 if __name__ == "__main__":
@@ -950,6 +4345,19 @@ if __name__ == "__main__":
     Logger.info("Running AutoSPEC with configuration file %s", config)
     spec_config = param(config)
     tune = spec_config.tune
+    if spec_config.time_budget > 0.0:
+        if spec_config.search == "greedy":
+            if spec_config.batch_benchmarks:
+                Logger.warning("batch_benchmarks is ignored with a time budget.")
+            spec_scheduler(spec_config, spec_config.benchmark_set).main()
+            exit(0)
+        Logger.warning("time_budget needs search = greedy, optimizing the benchmarks one by one.")
+    if spec_config.batch_benchmarks:
+        if tune == "peak" and spec_config.search == "greedy":
+            Logger.info("Optimizing the flags for the benchmarks %s together", spec_config.benchmark_set)
+            spec_batch(spec_config, spec_config.benchmark_set).main()
+            exit(0)
+        Logger.warning("batch_benchmarks needs tune = peak and search = greedy, optimizing the benchmarks one by one.")
     for benchmark in spec_config.benchmark_set:
         point_type, bench_no, bench_name = get_bench_number_name(tune, benchmark)
         Logger.info("Optimizing the flags for %s benchmark %s.%s", point_type, bench_no, bench_name)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# cython: language_level=3
+# A worker for the distributed mode of AutoSPEC. It runs in the SPEC directory of its machine, takes the
+# candidate config files from the coordinator, runs runspec and sends back the parsed results.
+# Usage:
+#   AutoSPECWorker.py http://coordinator:8426 [name]
+# The shared token of the coordinator, if any, is read from the environment variable AUTOSPEC_TOKEN,
+# and the runspec command from AUTOSPEC_RUNSPEC. AUTOSPEC_RESOURCE_USAGE=0 runs runspec without RunWithUsage.py.
+import sys
+import os
+import json
+import time
+import socket
+import asyncio
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from AutoSPEC import Logger, spec_output_parser, cutoff_policy, stream_cmd, runspec_cmd
+
+class task_config(object):
+    """
+    the runspec options of a task, in the form of runspec_cmd.
+    """
+    def __init__(self, task):
+        self.runspec = os.environ.get("AUTOSPEC_RUNSPEC", "runspec")
+        self.config_file = os.path.basename(task["config_file"])
+        self.tune = task["tune"]
+        self.copies = task["copies"]
+        self.iterations = task["iterations"]
+        self.bench_size = task["bench_size"]
+        self.resource_usage = os.environ.get("AUTOSPEC_RESOURCE_USAGE", "1") != "0"
+
+class spec_worker(object):
+    """
+    pull tasks from the coordinator and run them one by one.
+    """
+    def __init__(self, url, name, token="", poll=5.0):
+        """
+        Args:
+            url (str): the url of the coordinator, like http://192.168.1.10:8426
+            name (str): the name of this worker
+            token (str): the shared secret of the coordinator
+            poll (float): the seconds to wait when there is no task
+        """
+        self.url = url.rstrip("/")
+        self.name = name
+        self.token = token
+        self.poll = poll
+        self.config_dir = os.path.join(os.getcwd(), "config")
+
+    def post(self, path, request):
+        """
+        send a request to the coordinator.
+        Returns:
+            (int, dict): the status code and the reply, the status is None if the coordinator cannot be reached.
+        """
+        data = json.dumps(request).encode()
+        req = urllib.request.Request(self.url + path, data=data, method="POST",
+                                     headers={"Content-Type": "application/json", "X-AutoSPEC-Token": self.token})
+        try:
+            with urllib.request.urlopen(req, timeout=30) as fp:
+                body = fp.read()
+                return fp.status, json.loads(body) if body else None
+        except urllib.error.HTTPError as e:
+            return e.code, None
+        except (urllib.error.URLError, OSError) as e:
+            Logger.warning("Cannot reach the coordinator %s: %s", self.url, e)
+            return None, None
+
+    def main(self):
+        """
+        the main loop of the worker.
+        """
+        Logger.info("Worker %s is working for %s", self.name, self.url)
+        while True:
+            code, task = self.post("/lease", {"worker": self.name})
+            if code != 200:
+                if code == 403:
+                    Logger.error("The coordinator refused the token of worker %s.", self.name)
+                    return
+                time.sleep(self.poll)
+                continue
+            asyncio.run(self.run_task(task))
+
+    async def run_task(self, task):
+        """
+        write the config file of the task, run runspec and send the parsed output to the coordinator.
+        """
+        loop = asyncio.get_running_loop()
+        lease = {"task_id": task["task_id"], "lease": task["lease"]}
+        state = {"lost": False}
+        # the events and the completion are sent in order by one thread, without blocking the output of runspec.
+        sender = ThreadPoolExecutor(max_workers=1)
+        def send(kind, data):
+            request = dict(lease)
+            request["kind"] = kind
+            request["data"] = data
+            loop.run_in_executor(sender, self.post, "/event", request)
+        parser = spec_output_parser()
+        def on_build_error(bench_no, bench_name):
+            Logger.warning("Failed to build %s.%s", bench_no, bench_name)
+            send("build_error", [bench_no, bench_name])
+            if task["stop_on_build_error"]:
+                parser.kill()
+        parser.on_log_name = lambda log_name: send("log_name", log_name)
+        parser.on_result = lambda res: send("result", res)
+        parser.on_build_error = on_build_error
+        if task["cutoff"] is not None:
+            cutoff = task["cutoff"]
+            parser.cutoff = cutoff_policy(cutoff["runtimes"], cutoff["margin"], cutoff["iterations"])
+        config = task_config(task)
+        with parser.timer.span("update_cfg"):
+            with open(os.path.join(self.config_dir, config.config_file), "w") as fp:
+                fp.write(task["config_text"])
+                fp.close()
+        async def heartbeat():
+            while True:
+                await asyncio.sleep(task["heartbeat"])
+                code, reply = await loop.run_in_executor(None, self.post, "/heartbeat", lease)
+                if code == 410:
+                    Logger.warning("Task %s has been given to another worker, stopping runspec.", task["task_id"])
+                    state["lost"] = True
+                    parser.kill()
+                    return
+        beat = asyncio.ensure_future(heartbeat())
+        try:
+            await stream_cmd(runspec_cmd(config, task["benchmarks"]), parser)
+        finally:
+            beat.cancel()
+        if not state["lost"]:
+            request = dict(lease)
+            request["returncode"] = parser.returncode
+            request["dominated"] = parser.dominated
+            request["log_name"] = parser.log_name
+            request["result"] = parser.result
+            request["build_errors"] = parser.build_errors
+            request["timing"] = parser.timer.spans
+            request["usage"] = parser.usage
+            request["compile_times"] = parser.read_compile_times()
+            code, reply = await loop.run_in_executor(sender, self.post, "/complete", request)
+            if code != 200:
+                Logger.warning("The coordinator did not accept the result of task %s: %s", task["task_id"], code)
+        sender.shutdown()
+
+if __name__ == "__main__":
+    url = sys.argv[1]
+    name = sys.argv[2] if len(sys.argv) > 2 else "%s-%d" % (socket.gethostname(), os.getpid())
+    spec_worker(url, name, os.environ.get("AUTOSPEC_TOKEN", "")).main()
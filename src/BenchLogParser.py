@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# cython: language_level=3
+# A simple script to measure the throughput of the log parser on large synthetic CPU2006 logs.
+# Usage:
+#   BenchLogParser.py [size in MB, default 200] [repeats, default 3]
+import sys
+import os
+import re
+import time
+import random
+import tempfile
+from AutoSPEC import Benchmarks, spec_log, res_from_match
+
+def write_synthetic_log(fp, size, seed=0):
+    """
+    write a log of about size bytes, with the verbose output of runspec around the runs of the benchmarks.
+    Returns:
+        int: the number of results in the log
+    """
+    rng = random.Random(seed)
+    benchmarks = [(no, bench["name"]) for v in Benchmarks.values() for no, bench in v.items()]
+    fp.write("Reading config file '/home/spec/config/bench_x64.cfg'\n")
+    fp.write("The log for this run is in /home/spec/result/CPU2006.001.log\n")
+    noise = ["Specinvoke: /home/spec/bin/specinvoke -d /home/spec/benchspec/CPU2006/%s.%s/run/run_peak_ref_x64.0000 -e speccmds.err -o speccmds.stdout -f speccmds.cmd -C -q\n",
+             "  Compare command: /home/spec/bin/specperl /home/spec/bin/specdiff -m -l 10 --abstol 1e-07 %s.%s.out\n",
+             "Workload elapsed time (copy 0 workload 1) = 153.274 seconds\n",
+             "  Copy 0 of %s.%s (peak ref) run 1 finished at 2022-02-03 10:53:19.  Total elapsed time: 426.8\n"]
+    written = 0
+    results = 0
+    while written < size:
+        block = ["Running Benchmarks\n"]
+        for no, name in benchmarks:
+            block.append("  Running %s.%s ref peak x64 default\n" % (no, name))
+            for k in range(rng.randint(200, 400)):
+                line = noise[k % len(noise)]
+                block.append(line % (no, name) if "%s" in line else line)
+            block.append("  Success %s.%s peak ref ratio=%.2f, runtime=%.6f\n" % (no, name, rng.uniform(5, 50), rng.uniform(100, 1000)))
+            results += 1
+        text = "".join(block)
+        fp.write(text)
+        written += len(text)
+    return results
+
+def legacy_parse(log_file):
+    """
+    the former parser: read all the lines and search every line with each pattern.
+    """
+    with open(log_file, "r") as fp:
+        lines = fp.readlines()
+        fp.close()
+    res = []
+    for line in lines:
+        m = re.search(r"^\s+Success (?P<s_no>\d+).(?P<s_name>\w+) (?P<s_tune>\w+) (?P<s_size>\w+) ratio=(?P<s_ratio>\S+), runtime=(?P<s_time>\d+\.\d+)", line)
+        if m:
+            res.append(res_from_match(m))
+    for line in lines:
+        if re.search(r"Reading config file '(.*)'", line):
+            break
+    for line in lines:
+        if re.search(r"^logname\s+=\s+(.*)$", line) or re.search(r"The log for this run is in (.*)$", line):
+            break
+    return res
+
+def timed(func, repeats):
+    """
+    the best time of repeats calls of func, and its value.
+    """
+    best = None
+    for k in range(repeats):
+        start = time.perf_counter()
+        value = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, value
+
+if __name__ == "__main__":
+    size = float(sys.argv[1]) if len(sys.argv) > 1 else 200.0
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    with tempfile.NamedTemporaryFile("w", suffix=".log", delete=False) as fp:
+        results = write_synthetic_log(fp, int(size*1024**2))
+        log_file = fp.name
+    try:
+        mb = os.path.getsize(log_file)/1024**2
+        print("Synthetic log: %.1f MB, %d results" % (mb, results))
+        t_new, log = timed(lambda: spec_log.from_file(log_file), repeats)
+        print("spec_log.from_file: %.3f s, %.1f MB/s, %d results, %d runs" % (t_new, mb/t_new, len(log.result), len(log.runs)))
+        t_old, res = timed(lambda: legacy_parse(log_file), repeats)
+        print("legacy parser:      %.3f s, %.1f MB/s, %d results" % (t_old, mb/t_old, len(res)))
+        if res != log.result:
+            print("The results of the two parsers differ!")
+            sys.exit(1)
+    finally:
+        os.remove(log_file)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# cython: language_level=3
+# A simple script to compare how fast the search strategies of AutoSPEC converge, with FakeRunSpec.py as runspec.
+# Each strategy runs in its own temporary SPEC directory, and the best score is reported against the number
+# of runs and against the wall time. The true score of the best flags is the noiseless ratio of the model.
+# Usage:
+#   BenchSearch.py [--strategies greedy,ga,anneal,surrogate,halving,coordinate] [--benchmark 456] [--seeds 3]
+#                  [--model model.json] [--options examples/x64_gcc8/gcc-8.json] [-o curves.csv]
+import sys
+import os
+import csv
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from AutoSPEC import open_job_store, job_fitness, override_flags, get_bench_number_name
+from FakeRunSpec import load_model, fake_benchmark
+
+ProgramDir = os.path.abspath(os.path.dirname(__file__))
+ExampleDir = os.path.join(os.path.dirname(ProgramDir), "examples", "x64_gcc8")
+# small budgets, so that every strategy finishes in about the same number of runs.
+ConfTemplate = """[common]
+tune = peak
+copies = 1
+iterations = 1
+bench_size = ref
+benchmarks = {benchmark}
+config_file = bench_x64.cfg
+compiler_option_file = {options}
+option_rules_file = {rules}
+runspec = {runspec}
+job_store = jsonl
+search = {strategy}
+seed = {seed}
+noise = 0.005
+[ga]
+population = 10
+generations = 50
+[anneal]
+groups = 10
+steps = 50
+[surrogate]
+steps = 60
+init = 10
+[halving]
+candidates = 27
+rounds = 2
+"""
+
+def run_strategy(strategy, benchmark, seed, options, model_file):
+    """
+    run AutoSPEC with one strategy in a temporary directory.
+    Returns:
+        (list, float): the jobs in the order they were saved, and the start time
+    """
+    work_dir = tempfile.mkdtemp(prefix="BenchSearch.")
+    try:
+        os.makedirs(os.path.join(work_dir, "config"))
+        shutil.copy(os.path.join(ExampleDir, "bench_x64.cfg"), os.path.join(work_dir, "config"))
+        with open(os.path.join(work_dir, "SPEC.conf"), "w") as fp:
+            fp.write(ConfTemplate.format(benchmark=benchmark, options=os.path.abspath(options),
+                                         rules=os.path.join(ProgramDir, "options.json"),
+                                         runspec=os.path.join(ProgramDir, "FakeRunSpec.py"),
+                                         strategy=strategy, seed=seed))
+            fp.close()
+        env = dict(os.environ)
+        env["SPEC"] = work_dir
+        env["FAKE_RUNSPEC_MODEL"] = os.path.abspath(model_file) if model_file else ""
+        start = time.time()
+        with open(os.path.join(work_dir, "out.txt"), "w") as out:
+            subprocess.run([sys.executable, os.path.join(ProgramDir, "AutoSPEC.py"), "SPEC.conf"],
+                           cwd=work_dir, env=env, stdout=out, stderr=subprocess.STDOUT, check=True)
+        return open_job_store(work_dir, "jsonl").load(), start
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def convergence(jobs, start, bench, bench_no):
+    """
+    the best measured score and the true score of its flags after each job.
+    Returns:
+        list: (runs, seconds, best measured ratio, true ratio of the best flags) after each job
+    """
+    curve = []
+    runs = 0
+    best = 0.0
+    best_true = 0.0
+    for job in jobs:
+        runs += job.get("repeats", 1)
+        fitness = job_fitness(job, bench_no) if job["bench_size"] == "ref" else 0.0
+        if fitness > best:
+            best = fitness
+            best_true = bench.ratio(override_flags(sum(job["gcc_flags"], [])))
+        curve.append((runs, job.get("end_time", start) - start, best, best_true))
+    return curve
+
+def first_reach(curve, target):
+    """
+    the runs and seconds when the true score of the best flags first reaches target.
+    """
+    for runs, seconds, best, best_true in curve:
+        if best_true >= target:
+            return runs, seconds
+    return None, None
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="compare the search strategies of AutoSPEC on a fake runspec")
+    arg_parser.add_argument("--strategies", default="greedy,ga,anneal,surrogate,halving,coordinate")
+    arg_parser.add_argument("--benchmark", default="456")
+    arg_parser.add_argument("--seeds", type=int, default=1)
+    arg_parser.add_argument("--model", default=None, help="the model file of FakeRunSpec.py")
+    arg_parser.add_argument("--options", default=os.path.join(ExampleDir, "gcc-8.json"), help="the compiler option file")
+    arg_parser.add_argument("-o", "--output", default=None, help="write the convergence curves to a CSV file")
+    args = arg_parser.parse_args()
+    if args.model:
+        os.environ["FAKE_RUNSPEC_MODEL"] = os.path.abspath(args.model)
+    point_type, bench_no, bench_name = get_bench_number_name("peak", args.benchmark)
+    bench = fake_benchmark(load_model(), bench_no, bench_name)
+    curves = {}
+    for strategy in args.strategies.split(","):
+        for seed in range(1, args.seeds + 1):
+            print("Running %s with seed %d" % (strategy, seed), flush=True)
+            jobs, start = run_strategy(strategy, args.benchmark, seed, args.options, args.model)
+            curves[(strategy, seed)] = convergence(jobs, start, bench, bench_no)
+    best_true = max(curve[-1][3] for curve in curves.values() if len(curve) > 0)
+    print("\nThe best true ratio of all the runs is %.3f, the ratio with no flags is %.3f" % (best_true, bench.ratio([])))
+    print("%-10s %4s %6s %8s %10s %10s %14s %14s" % ("strategy", "seed", "runs", "seconds", "best", "true", "runs to 99%", "seconds to 99%"))
+    for (strategy, seed), curve in curves.items():
+        runs, seconds, best, true = curve[-1] if len(curve) > 0 else (0, 0.0, 0.0, 0.0)
+        reach_runs, reach_seconds = first_reach(curve, 0.99*best_true)
+        print("%-10s %4d %6d %8.1f %10.3f %10.3f %14s %14s" % (strategy, seed, runs, seconds, best, true,
+              "-" if reach_runs is None else reach_runs, "-" if reach_seconds is None else "%.1f" % (reach_seconds)))
+    if args.output:
+        with open(args.output, "w", newline="") as fp:
+            writer = csv.writer(fp)
+            writer.writerow(["strategy", "seed", "runs", "seconds", "best", "true"])
+            for (strategy, seed), curve in curves.items():
+                for runs, seconds, best, true in curve:
+                    writer.writerow([strategy, seed, runs, "%.3f" % (seconds), "%.4f" % (best), "%.4f" % (true)])
+            fp.close()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# cython: language_level=3
+# A deterministic stand-in for runspec, to try the searches of AutoSPEC without SPEC CPU 2006.
+# It reads the flags of each benchmark from the config file and prints the output of runspec
+# with a synthetic ratio, computed from the effect of each flag, the interactions between pairs of flags and noise.
+# Usage:
+#   set "runspec = /path/to/FakeRunSpec.py" in the [common] section of SPEC.conf, and run AutoSPEC in an
+#   empty directory with config/ and the compiler option file, like the ones of BenchSearch.py.
+# The model is read from the JSON file in the environment variable FAKE_RUNSPEC_MODEL, see DefaultModel.
+import sys
+import os
+import json
+import time
+import math
+import fcntl
+import random
+import hashlib
+import argparse
+from AutoSPEC import Benchmarks, OptMap, spec_cfg, override_flags, get_bench_number_name, get_exe_dir, option_model, flag_family
+
+# the model of the scores, every key can be set in the model file.
+DefaultModel = {
+    # the seed of the flag effects, the interactions and the noise.
+    "seed": 0,
+    # the relative standard deviation of the ratio of each run.
+    "noise": 0.005,
+    # the effect of a flag not in "effects" is drawn from a normal distribution, half of it shared by
+    # all the benchmarks and half of it specific to each benchmark.
+    "effect_mean": -0.002,
+    "effect_scale": 0.02,
+    # the relative effect of each flag, like {"-funroll-loops": 0.03}.
+    "effects": {"-O0": -0.6, "-O1": -0.1, "-O2": 0.0, "-O3": 0.03, "-Os": -0.05, "-Ofast": 0.05},
+    # each pair of flags interacts with this probability, with a normally distributed effect.
+    "interaction_rate": 0.05,
+    "interaction_scale": 0.02,
+    # the interactions which are always present, like [{"flags": ["-O3", "-funroll-loops"], "effect": 0.02}].
+    "interactions": [],
+    # the implies of this option file are enabled by the flags implying them, like a compiler does,
+    # so a flag implied by another one has no effect of its own.
+    "rules_file": os.path.join(os.path.dirname(os.path.abspath(__file__)), "options.json"),
+    # the flags which fail to build.
+    "build_errors": [],
+    # the ratio with the empty flags, from 10 to 40 if the benchmark is not given.
+    "base_ratio": {},
+    # the simulated seconds to compile a benchmark, growing by compile_time_per_flag for each flag.
+    "compile_time": 60.0,
+    "compile_time_per_flag": 0.02,
+    # sleep time_scale seconds for each second of the simulated runtime and compile time.
+    "time_scale": 0.0,
+    # the settings for each benchmark number, with the same keys as above.
+    "benchmarks": {}
+}
+# the reference times of SPEC CPU 2006 in seconds.
+RefTimes = {"400": 9770, "401": 9650, "403": 8050, "429": 9120, "445": 10490, "456": 9330,
+            "458": 12100, "462": 20720, "464": 22130, "471": 6250, "473": 7020, "483": 6900,
+            "410": 13590, "416": 19580, "433": 9180, "434": 9100, "435": 7140, "436": 11950,
+            "437": 9400, "444": 8020, "447": 11440, "450": 8340, "453": 5320, "454": 8250,
+            "459": 10610, "465": 9840, "470": 13740, "481": 11170, "482": 19490}
+SizeScales = {"test": 0.002, "train": 0.05, "ref": 1.0}
+
+RulesCache = {}
+
+def load_rules(rules_file):
+    """
+    the option model of the rules file, or None without one.
+    """
+    if not rules_file or not os.path.exists(rules_file):
+        return None
+    if rules_file not in RulesCache:
+        RulesCache[rules_file] = option_model(rules_file)
+    return RulesCache[rules_file]
+
+def hashed_random(*keys):
+    """
+    a random generator which only depends on the keys.
+    """
+    digest = hashlib.md5(" ".join(str(key) for key in keys).encode()).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+def load_model():
+    """
+    the default model updated with the model file.
+    """
+    model = dict(DefaultModel)
+    model_file = os.environ.get("FAKE_RUNSPEC_MODEL")
+    if model_file:
+        with open(model_file, "r") as fp:
+            model.update(json.load(fp))
+            fp.close()
+    return model
+
+class fake_benchmark(object):
+    """
+    the synthetic performance of one benchmark.
+    """
+    def __init__(self, model, bench_no, bench_name):
+        self.bench_no = bench_no
+        self.bench_name = bench_name
+        self.model = dict(model)
+        self.model.update(model["benchmarks"].get(bench_no, {}))
+        self.effects = dict(model["effects"])
+        self.effects.update(model["benchmarks"].get(bench_no, {}).get("effects", {}))
+        self.seed = self.model["seed"]
+        self.rules = load_rules(self.model["rules_file"])
+
+    def base_ratio(self):
+        if self.bench_no in self.model["base_ratio"]:
+            return self.model["base_ratio"][self.bench_no]
+        return hashed_random(self.seed, "base", self.bench_no).uniform(10.0, 40.0)
+
+    def effect(self, flag):
+        if flag in self.effects:
+            return self.effects[flag]
+        shared = hashed_random(self.seed, "effect", flag).gauss(0.0, 1.0)
+        specific = hashed_random(self.seed, "effect", self.bench_no, flag).gauss(0.0, 1.0)
+        effect = self.model["effect_mean"] + self.model["effect_scale"]*(shared + specific)/math.sqrt(2.0)
+        return min(max(effect, -0.5), 0.5)
+
+    def interaction(self, flag1, flag2):
+        for item in self.model["interactions"]:
+            if set(item["flags"]) == set([flag1, flag2]):
+                return item["effect"]
+        rng = hashed_random(self.seed, "interaction", self.bench_no, flag1, flag2)
+        if rng.random() < self.model["interaction_rate"]:
+            return rng.gauss(0.0, self.model["interaction_scale"])
+        return 0.0
+
+    def fails(self, flags):
+        """
+        the flags which fail to build.
+        """
+        return [flag for flag in flags if flag in self.model["build_errors"]]
+
+    def enabled(self, flags):
+        """
+        the flags and the flags they imply, unless a flag of the same family is given.
+        A flag overridden by a later flag is not enabled, like -fmath-errno before -ffast-math.
+        """
+        enabled = list(flags)
+        if self.rules is None:
+            return enabled
+        enabled, removed = self.rules.normalize(enabled)
+        flags = list(enabled)
+        families = set(flag_family(flag) for flag in flags)
+        for flag in flags:
+            for implied in sorted(self.rules.closure(flag)):
+                if flag_family(implied) not in families:
+                    families.add(flag_family(implied))
+                    enabled.append(implied)
+        return enabled
+
+    def ratio(self, flags):
+        """
+        the noiseless ratio of the flags.
+        """
+        flags = self.enabled(flags)
+        log_ratio = math.log(self.base_ratio())
+        for flag in flags:
+            log_ratio += math.log1p(self.effect(flag))
+        for i in range(len(flags)):
+            for j in range(i + 1, len(flags)):
+                log_ratio += math.log1p(max(self.interaction(flags[i], flags[j]), -0.5))
+        return math.exp(log_ratio)
+
+    def run(self, flags, size, run_id):
+        """
+        the ratio and the runtime of one run.
+        """
+        noise = hashed_random(self.seed, "noise", self.bench_no, run_id).gauss(0.0, self.model["noise"])
+        ratio = self.ratio(flags)*(1.0 + noise)
+        runtime = RefTimes.get(self.bench_no, 10000)*SizeScales.get(size, 1.0)/ratio
+        return ratio, runtime
+
+def benchmark_flags(cfg, tune, point_type, bench_no, bench_name):
+    """
+    the flags of a benchmark in the config file, with only the last flag of each family, in their order.
+    """
+    if tune == "base":
+        section = cfg.base_section(point_type)
+    else:
+        section = cfg.peak_section(bench_no, bench_name)
+    flags = []
+    for var in ["OPTIMIZE"] + list(OptMap.values()):
+        flags.append((cfg.get(var, section, "") or cfg.get(var, "default=%s=default=default" % (tune), "")).split())
+    return override_flags(" ".join(sum(flags, [])).split())
+
+def next_run_id(spec_dir):
+    """
+    a counter of the runs, so that repeated runs get different noise.
+    """
+    counter_file = os.path.join(spec_dir, ".FakeRunSpec.count")
+    with open(counter_file, "a+") as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        fp.seek(0)
+        text = fp.read().strip()
+        run_id = int(text) + 1 if text else 1
+        fp.seek(0)
+        fp.truncate()
+        fp.write("%d\n" % (run_id))
+    return run_id
+
+def expand_benchmarks(names, tune):
+    """
+    the (point type, number, name) of the benchmarks on the command line.
+    """
+    benches = []
+    for name in names:
+        if name in ["int", "fp"]:
+            benches.extend((name, no, bench["name"]) for no, bench in Benchmarks[name].items())
+        elif name == "all":
+            benches.extend((point_type, no, bench["name"]) for point_type, v in Benchmarks.items() for no, bench in v.items())
+        else:
+            point_type, bench_no, bench_name = get_bench_number_name("peak", name.split(".")[-1] if "." in name else name)
+            if bench_no is not None:
+                benches.append((point_type, bench_no, bench_name))
+    return benches
+
+def main(argv):
+    arg_parser = argparse.ArgumentParser(description="a fake runspec")
+    arg_parser.add_argument("--config", required=True)
+    arg_parser.add_argument("--tune", default="base")
+    arg_parser.add_argument("-C", "--copies", type=int, default=1)
+    arg_parser.add_argument("--iterations", type=int, default=3)
+    arg_parser.add_argument("-i", "--size", default="ref")
+    arg_parser.add_argument("--action", default="validate")
+    arg_parser.add_argument("--nobuild", action="store_true")
+    arg_parser.add_argument("--noreportable", action="store_true")
+    arg_parser.add_argument("--ignoreerror", action="store_true")
+    arg_parser.add_argument("benchmarks", nargs="+")
+    args = arg_parser.parse_args(argv)
+    spec_dir = os.environ.get("SPEC", os.getcwd())
+    config_file = args.config if os.path.isabs(args.config) else os.path.join(os.getcwd(), "config", args.config)
+    with open(config_file, "r") as fp:
+        cfg = spec_cfg(fp.readlines())
+        fp.close()
+    ext = cfg.get("ext", default="none")
+    model = load_model()
+    run_id = next_run_id(spec_dir)
+    result_dir = os.path.join(spec_dir, "result")
+    os.makedirs(result_dir, exist_ok=True)
+    log_name = os.path.join(result_dir, "CPU2006.%03d.log" % (run_id))
+    log = open(log_name, "w")
+    def out(line):
+        try:
+            print(line, flush=True)
+        except BrokenPipeError:
+            # like runspec, finish the run and its log when AutoSPEC is gone.
+            sys.stdout = open(os.devnull, "w")
+        log.write(line + "\n")
+        log.flush()
+    out("Reading config file '%s'" % (config_file))
+    out("logname = %s" % (log_name))
+    benches = expand_benchmarks(args.benchmarks, args.tune)
+    tunes = ["base", "peak"] if args.tune == "all" else args.tune.split(",")
+    runs = []
+    errors = []
+    for point_type, bench_no, bench_name in benches:
+        for tune in tunes:
+            bench = fake_benchmark(model, bench_no, bench_name)
+            exe = os.path.join(get_exe_dir(spec_dir, bench_no, bench_name), "%s_%s.%s" % (bench_name, tune, ext))
+            if args.nobuild or args.action == "run":
+                # the flags the executable was built with.
+                if not os.path.exists(exe):
+                    errors.append("%s.%s(%s)" % (bench_no, bench_name, tune))
+                    continue
+                with open(exe, "r") as fp:
+                    flags = json.load(fp)
+                    fp.close()
+            else:
+                flags = benchmark_flags(cfg, tune, point_type, bench_no, bench_name)
+                out("  Building %s.%s %s %s default: (build_%s_%s.0000)" % (bench_no, bench_name, tune, ext, tune, ext))
+                if len(bench.fails(flags)) > 0:
+                    out("*** Error building %s.%s" % (bench_no, bench_name))
+                    errors.append("%s.%s(%s; CE)" % (bench_no, bench_name, tune))
+                    continue
+                compile_time = int(bench.model["compile_time"]*(1.0 + bench.model["compile_time_per_flag"]*len(flags)))
+                if model["time_scale"] > 0.0:
+                    time.sleep(compile_time*model["time_scale"])
+                # like runspec, the compile time is only in the log.
+                log.write("  Elapsed compile for '%s.%s': %s (%d)\n" % (bench_no, bench_name, time.strftime("%H:%M:%S", time.gmtime(compile_time)), compile_time))
+                os.makedirs(os.path.dirname(exe), exist_ok=True)
+                with open(exe, "w") as fp:
+                    json.dump(flags, fp)
+                    fp.close()
+            runs.append((bench, tune, flags))
+    if len(errors) > 0:
+        out("Build errors: %s" % (", ".join(errors)))
+    if args.action != "build":
+        out("Running Benchmarks")
+        for iteration in range(args.iterations):
+            for bench, tune, flags in runs:
+                out("  Running %s.%s %s %s %s default" % (bench.bench_no, bench.bench_name, args.size, tune, ext))
+                ratio, runtime = bench.run(flags, args.size, "%d.%d" % (run_id, iteration))
+                if model["time_scale"] > 0.0:
+                    time.sleep(runtime*model["time_scale"])
+                out("  Success %s.%s %s %s ratio=%.2f, runtime=%.6f" % (bench.bench_no, bench.bench_name, tune, args.size, ratio, runtime))
+    out("The log for this run is in %s" % (log_name))
+    log.close()
+    return 1 if len(errors) > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
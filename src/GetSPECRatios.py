@@ -3,9 +3,118 @@
 # cython: language_level=3
 # Time-stamp: <Last updated: ZHAO,Ya-Fan yafanzhao@163.com 2022-02-03 10:53:19>
 # A simple script to print the ratios from the benchmark log file.
+# Usage:
+#   GetSPECRatios.py result/CPU2006.001.log           print the ratios and scores of one log
+#   GetSPECRatios.py result [-o table.csv] [-j 8]     summarize all the CPU2006.*.log files in a directory
+#   GetSPECRatios.py 'result/CPU2006.0*.log' -o table.json
+# In the batch mode, the summary of each log is kept in an index file next to the logs,
+# so only new or modified logs are parsed again.
 import sys
-from AutoSPEC import parse_log_file
+import os
+import csv
+import glob
+import logging
+import argparse
+import multiprocessing
+from AutoSPEC import Benchmarks, Logger, parse_log_file, spec_log, filter_res, GetScore, load_json, dump_json
+
+# the name, tune and point type of each suite score.
+Suites = [("BaseInt", "base", "int"), ("BaseFP", "base", "fp"), ("PeakInt", "peak", "int"), ("PeakFP", "peak", "fp")]
+IndexFile = ".GetSPECRatios.json"
+
+def summarize_log(log_file):
+    """
+    the mean ratio of each benchmark and the score of each suite in a log file.
+    The ratios are keyed by "tune size NNN.name", a suite without all its benchmarks scores 0.0.
+    """
+    log = spec_log.from_file(log_file)
+    ratios = {}
+    for r in log.result:
+        key = "%s %s %s.%s" % (r["Tune"], r["BenchSize"], r["BenchNO"], r["BenchName"])
+        ratios.setdefault(key, []).append(r["Ratio"])
+    summary = {"log_file": log_file, "config_file": log.config_file}
+    for name, tune, point_type in Suites:
+        res = filter_res(log.result, tune, "ref", point_type)
+        if len(set(r["BenchNO"] for r in res)) == len(Benchmarks[point_type]):
+            summary[name] = GetScore(res)
+        else:
+            summary[name] = 0.0
+    summary["ratios"] = {key: sum(values)/len(values) for key, values in ratios.items()}
+    return summary
+
+def find_logs(target):
+    """
+    the log files of a directory or a glob pattern.
+    """
+    if os.path.isdir(target):
+        target = os.path.join(target, "CPU2006.*.log")
+    return sorted(os.path.abspath(log_file) for log_file in glob.glob(target))
+
+def summarize_logs(log_files, index_file, jobs):
+    """
+    the summary of each log file, parsing only the logs which are not in the index or have changed since.
+    Args:
+        log_files (list): the absolute paths of the log files
+        index_file (str): the index of the summaries, keyed by path, with the mtime and the size of each log
+        jobs (int): the number of processes parsing the logs
+    """
+    index = load_json(index_file) if os.path.exists(index_file) else {}
+    stats = {}
+    stale = []
+    for log_file in log_files:
+        st = os.stat(log_file)
+        stats[log_file] = [st.st_mtime_ns, st.st_size]
+        entry = index.get(log_file)
+        if entry is None or [entry["mtime"], entry["size"]] != stats[log_file]:
+            stale.append(log_file)
+    Logger.info("%d of %d logs are new or modified", len(stale), len(log_files))
+    if len(stale) > 0:
+        if jobs > 1 and len(stale) > 1:
+            with multiprocessing.Pool(jobs) as pool:
+                summaries = pool.map(summarize_log, stale, chunksize=max(1, len(stale)//(4*jobs)))
+        else:
+            summaries = [summarize_log(log_file) for log_file in stale]
+        for log_file, summary in zip(stale, summaries):
+            index[log_file] = {"mtime": stats[log_file][0], "size": stats[log_file][1], "summary": summary}
+        dump_json(index, index_file)
+    return [index[log_file]["summary"] for log_file in log_files]
+
+def write_table(summaries, output):
+    """
+    write the summaries as a JSON list, or as a CSV table with a column for each score and each benchmark.
+    """
+    if output.endswith(".json"):
+        dump_json(summaries, output)
+        return
+    keys = sorted(set(key for summary in summaries for key in summary["ratios"].keys()))
+    header = ["log_file", "config_file"] + [name for name, tune, point_type in Suites] + keys
+    fp = sys.stdout if output == "-" else open(output, "w", newline="")
+    writer = csv.writer(fp)
+    writer.writerow(header)
+    for summary in summaries:
+        row = [summary["log_file"], summary["config_file"]] + ["%.2f" % (summary[name]) for name, tune, point_type in Suites]
+        row += ["%.2f" % (summary["ratios"][key]) if key in summary["ratios"] else "" for key in keys]
+        writer.writerow(row)
+    if fp is not sys.stdout:
+        fp.close()
 
 if __name__ == "__main__":
-    log_file = sys.argv[1]
-    parse_log_file(log_file)
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="print the ratios and scores in CPU2006 log files")
+    arg_parser.add_argument("logs", help="a log file, a directory of CPU2006.*.log files, or a glob pattern")
+    arg_parser.add_argument("-o", "--output", default="-", help="the table to write, .csv or .json, default is csv to stdout")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="the number of processes parsing the logs")
+    arg_parser.add_argument("--index", default=None, help="the index file, default is %s next to the logs" % (IndexFile))
+    args = arg_parser.parse_args()
+    if os.path.isfile(args.logs):
+        parse_log_file(args.logs)
+        sys.exit(0)
+    if args.output == "-":
+        # the log messages of AutoSPEC go to stdout too.
+        Logger.setLevel(logging.WARNING)
+    log_dir = args.logs if os.path.isdir(args.logs) else os.path.dirname(args.logs)
+    index_file = args.index if args.index is not None else os.path.join(log_dir, IndexFile)
+    log_files = find_logs(args.logs)
+    if len(log_files) == 0:
+        Logger.error("Cannot find any log in %s", args.logs)
+        sys.exit(1)
+    write_table(summarize_logs(log_files, index_file, args.jobs), args.output)
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# cython: language_level=3
+# A simple script to maintain the job store of AutoSPEC.
+# Usage:
+#   JobStore.py SPEC.conf compact           compact the job store in the SPEC.conf
+#   JobStore.py SPEC.conf import jobs.json  import the jobs from a jobs.json file
+import sys
+from AutoSPEC import param
+
+if __name__ == "__main__":
+    spec_config = param(sys.argv[1])
+    command = sys.argv[2]
+    if command == "compact":
+        spec_config.job_store.compact()
+    elif command == "import":
+        spec_config.job_store.import_jobs(sys.argv[3])
+    else:
+        print("Unknown command %s, it should be compact or import." % (command))
+        sys.exit(1)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# cython: language_level=3
+# Run a command, like runspec, and print the resource usage of its process tree as the last line of its output.
+# AutoSPEC starts runspec through this script and stores the usage with each job.
+# Usage:
+#   RunWithUsage.py runspec --config bench_x64.cfg --tune peak ... 456
+import sys
+import os
+import json
+import time
+import subprocess
+
+# the prefix of the usage line, imported by AutoSPEC.py for its log pattern.
+UsageMarker = "AutoSPEC usage: "
+
+def main(argv):
+    start = time.monotonic()
+    try:
+        # SIGPIPE stays ignored, see stream_cmd in AutoSPEC.py.
+        proc = subprocess.Popen(argv, restore_signals=False)
+    except OSError as e:
+        print("Cannot run %s: %s" % (argv[0], e), file=sys.stderr)
+        return 127
+    # the usage of the child includes all the descendants it has waited for.
+    pid, status, usage = os.wait4(proc.pid, 0)
+    record = {"wall": round(time.monotonic() - start, 3),
+              "utime": round(usage.ru_utime, 3),
+              "stime": round(usage.ru_stime, 3),
+              "maxrss_kb": usage.ru_maxrss,
+              "minflt": usage.ru_minflt,
+              "majflt": usage.ru_majflt,
+              "nvcsw": usage.ru_nvcsw,
+              "nivcsw": usage.ru_nivcsw,
+              "inblock": usage.ru_inblock,
+              "oublock": usage.ru_oublock}
+    try:
+        print(UsageMarker + json.dumps(record), flush=True)
+    except BrokenPipeError:
+        pass
+    return os.waitstatus_to_exitcode(status)
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# cython: language_level=3
+# A simple script to summarize where the time of the tuning goes, from the timing.jsonl file of AutoSPEC.
+# Each job records the seconds spent in update_cfg, cache, build, run, parse, repeat, persist and wait.
+# Usage:
+#   SummarizeTiming.py [timing.jsonl] [--by benchmark|strategy|tune] [-o summary.csv]
+import sys
+import csv
+import json
+import argparse
+
+Phases = ["update_cfg", "cache", "build", "run", "parse", "repeat", "persist", "wait"]
+
+def load_records(timing_file):
+    """
+    the records of the timing file, an incomplete last line is skipped.
+    """
+    records = []
+    with open(timing_file, "r") as fp:
+        for line in fp:
+            if line.strip():
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    pass
+        fp.close()
+    return records
+
+def summarize(records, key):
+    """
+    the number of jobs and the total seconds of each phase, for each value of key and for all the jobs.
+    Returns:
+        dict: {value of key: (number of jobs, {phase: seconds})}, with the total under "all"
+    """
+    groups = {}
+    for record in records:
+        for group in [record.get(key, ""), "all"]:
+            count, spans = groups.get(group, (0, {}))
+            for name, seconds in record["spans"].items():
+                spans[name] = spans.get(name, 0.0) + seconds
+            groups[group] = (count + 1, spans)
+    return groups
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="summarize the time spent in each phase of the tuning")
+    arg_parser.add_argument("timing_file", nargs="?", default="timing.jsonl")
+    arg_parser.add_argument("--by", default="benchmark_name", help="group the jobs by benchmark_name, strategy, tune or bench_size")
+    arg_parser.add_argument("-o", "--output", default=None, help="write the total seconds of each phase to a CSV file")
+    args = arg_parser.parse_args()
+    if args.by == "benchmark":
+        args.by = "benchmark_name"
+    groups = summarize(load_records(args.timing_file), args.by)
+    if len(groups) == 0:
+        print("No jobs in %s" % (args.timing_file))
+        sys.exit(1)
+    phases = Phases + sorted(set(name for count, spans in groups.values() for name in spans) - set(Phases))
+    print("%-20s %6s %10s %10s  %s" % (args.by, "jobs", "total", "per job", "  ".join("%12s" % (name) for name in phases)))
+    for group, (count, spans) in sorted(groups.items(), key=lambda item: (item[0] == "all", str(item[0]))):
+        total = sum(spans.values())
+        shares = ["%11.1f%%" % (100.0*spans.get(name, 0.0)/total if total > 0.0 else 0.0) for name in phases]
+        print("%-20s %6d %10.1f %10.2f  %s" % (group, count, total, total/count, "  ".join(shares)))
+    if args.output:
+        with open(args.output, "w", newline="") as fp:
+            writer = csv.writer(fp)
+            writer.writerow([args.by, "jobs"] + phases)
+            for group, (count, spans) in groups.items():
+                writer.writerow([group, count] + ["%.3f" % (spans.get(name, 0.0)) for name in phases])
+            fp.close()